@@ -0,0 +1,161 @@
+import importlib.util
+import os
+
+import numpy as np
+
+from src import vectorized
+
+# Backend used when a model is built without one
+BACKEND_ENV = "TRAFFIC_BACKEND"
+
+BACKENDS = {}
+
+
+def register_backend(cls):
+    BACKENDS[cls.name] = cls
+    return cls
+
+
+def get_backend(backend=None, default="python"):
+    # Accepts a Backend, a registered name, or None to read TRAFFIC_BACKEND
+    # and fall back to `default`.
+    if isinstance(backend, Backend):
+        return backend
+    name = backend or os.environ.get(BACKEND_ENV) or default
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}, available: "
+                         f"{', '.join(sorted(BACKENDS))}")
+    return BACKENDS[name]()
+
+
+class Backend:
+    # Step kernels for one phase each. Every kernel updates model.highway
+    # (and model.flow_count) in place of the model's own phase methods.
+    # update_lanes returns the lane changes attempted and made, merge_cars
+    # the number of cars that merged around a blockage.
+    name = None
+
+    def update_lanes(self, model):
+        raise NotImplementedError
+
+    def update_velocity(self, model):
+        raise NotImplementedError
+
+    def update_position(self, model):
+        raise NotImplementedError
+
+    def merge_cars(self, model):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"{type(self).__name__}()"
+
+
+@register_backend
+class PythonBackend(Backend):
+    # The reference cell-by-cell loops of NSModel and Zipper
+    name = "python"
+
+    def update_lanes(self, model):
+        return model.update_lanes()
+
+    def update_velocity(self, model):
+        model.update_velocity()
+
+    def update_position(self, model):
+        model.update_position()
+
+    def merge_cars(self, model):
+        return model.merge_cars()
+
+
+@register_backend
+class NumpyBackend(Backend):
+    name = "numpy"
+
+    def update_lanes(self, model):
+        # The occupancy bitmap, kept up to date through the lane changes, is
+        # handed to the velocity phase so it is built once per step
+        model.bits = vectorized.occupancy_bits(
+            model.highway.reshape(-1, model.highway.shape[-1]))
+        return vectorized.update_lanes(model.highway, model.prob,
+                                       model.max_velocity, model.rng,
+                                       model.bits)
+
+    def update_velocity(self, model):
+        bits = getattr(model, "bits", None)
+        model.bits = None
+        vectorized.update_velocity(model.highway, model.prob,
+                                   model.max_velocity, model.rng, bits)
+
+    def hold(self, model):
+        # Zipper cars stopped in front of their lane's blockage
+        if not hasattr(model, "block_distance"):
+            return None
+        return (0 <= model.highway) & (np.maximum(model.highway, 1) >=
+                                       model.block_distance)
+
+    def spare(self, model):
+        # The grid the positions are written to: the one replaced by the step
+        # before, so two grids are swapped every step instead of allocating
+        spare = getattr(model, "spare", None)
+        if (spare is None or spare is model.highway
+                or spare.shape != model.highway.shape
+                or spare.dtype != model.highway.dtype):
+            spare = np.empty_like(model.highway)
+        return spare
+
+    def update_position(self, model):
+        model.held = self.hold(model)
+        updated, flow = vectorized.update_position(model.highway,
+                                                   model.held,
+                                                   out=self.spare(model))
+        model.spare, model.highway = model.highway, updated
+        model.flow_count += int(flow.sum())
+
+    def merge_cars(self, model):
+        held = getattr(model, "held", None)
+        if held is None:
+            return 0
+        model.held = None
+        return vectorized.merge(model.highway, held, model.can_merge)
+
+
+# The compiled kernels, imported when a numba backend is first made as
+# loading numba takes most of the import time of the package
+jit = None
+
+
+def load_jit():
+    global jit
+    if jit is None:
+        from src import jit as kernels
+        jit = kernels
+    return jit
+
+
+if importlib.util.find_spec("numba") is not None:
+
+    @register_backend
+    class NumbaBackend(NumpyBackend):
+        # Compiled loops drawing the same uniforms in the same order as the
+        # numpy kernels, so both give identical runs for the same seed.
+        name = "numba"
+
+        def __init__(self):
+            load_jit()
+
+        def update_lanes(self, model):
+            return jit.update_lanes(model.highway, model.prob,
+                                    model.max_velocity, model.rng)
+
+        def update_velocity(self, model):
+            jit.update_velocity(model.highway, model.prob,
+                                model.max_velocity, model.rng)
+
+        def update_position(self, model):
+            model.held = self.hold(model)
+            updated, flow = jit.update_position(model.highway, model.held,
+                                                out=self.spare(model))
+            model.spare, model.highway = model.highway, updated
+            model.flow_count += int(flow.sum())
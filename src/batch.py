@@ -0,0 +1,152 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import tomllib
+
+import numpy as np
+
+from src.cache import ResultCache
+from src.observables import OBSERVABLES
+from src.points import MODELS, run_scenario
+from src.scheduler import run_tasks
+
+# Batch runs of studies described in a JSON or TOML file, e.g.
+#
+#   {"name": "zipper_flow", "model": "Zipper", "replicas": 4,
+#    "steps": 500, "warmup": 200, "seed": 1,
+#    "observe": ["velocity", "flow", "jammed"],
+#    "params": {"n_lanes": 3, "lane_len": 200, "prob": 0.5},
+#    "grid": {"lane_density": {"start": 0.05, "stop": 1, "step": 0.05},
+#             "max_velocity": [1, 3, 5]}}
+#
+# Every combination of the grid values is run `replicas` times, with the
+# fixed params, as one task on the process pool. A file may instead hold a
+# list of such studies under "studies", its other keys (and params) being
+# defaults for all of them. Each study is written to <output>/<name>.npz
+# with one column per grid parameter, the replica index and the mean of
+# every observable, one row per task, plus the study itself as JSON.
+
+DEFAULTS = {
+    "model": "NSModel",
+    "replicas": 1,
+    "steps": 100,
+    "warmup": 100,
+    "every": 1,
+    "seed": 0,
+    "observe": ["velocity", "flow"],
+    "params": {},
+    "grid": {},
+}
+
+
+def load_studies(path):
+    with open(path, "rb") as file:
+        config = tomllib.load(file) if path.endswith(".toml") else \
+            json.load(file)
+    studies = config.pop("studies", None)
+    if studies is None:
+        studies = [config]
+        config = {}
+    name = os.path.splitext(os.path.basename(path))[0]
+    return [{
+        **DEFAULTS,
+        "name": name if len(studies) == 1 else f"{name}_{index}",
+        **config,
+        **study,
+        "params": {
+            **config.get("params", {}),
+            **study.get("params", {})
+        },
+    } for index, study in enumerate(studies)]
+
+
+def grid_values(spec):
+    # A list of values, a single value, or {"start", "stop", "step"} for a
+    # range including stop
+    if isinstance(spec, dict):
+        return np.arange(spec["start"], spec["stop"] + spec["step"] / 2,
+                         spec["step"]).tolist()
+    if isinstance(spec, (list, tuple)):
+        return list(spec)
+    return [spec]
+
+
+def expand(study):
+    # The tasks of a study, one per grid point and replica in row-major grid
+    # order, and the grid columns of the rows
+    if study["model"] not in MODELS:
+        raise ValueError(f"Unknown model {study['model']!r}, available: "
+                         f"{', '.join(sorted(MODELS))}")
+    unknown = set(study["observe"]) - set(OBSERVABLES)
+    if unknown:
+        raise ValueError(f"Unknown observables {sorted(unknown)}")
+
+    names = list(study["grid"])
+    axes = [grid_values(study["grid"][name]) for name in names]
+    tasks = []
+    columns = {name: [] for name in names + ["replica"]}
+    for point in itertools.product(*axes):
+        for replica in range(study["replicas"]):
+            tasks.append({
+                "model": study["model"],
+                "steps": study["steps"],
+                "warmup": study["warmup"],
+                "every": study["every"],
+                "observe": list(study["observe"]),
+                **study["params"],
+                **dict(zip(names, point))
+            })
+            for name, value in zip(names, point):
+                columns[name].append(value)
+            columns["replica"].append(replica)
+    return tasks, {name: np.array(values) for name, values in columns.items()}
+
+
+def run_study(study, output="./results", workers=None, cache=None):
+    tasks, columns = expand(study)
+    results = run_tasks(run_scenario,
+                        tasks,
+                        workers=workers,
+                        seed=study["seed"],
+                        label=study["name"],
+                        cache=cache)
+    results = np.reshape(results, (len(tasks), len(study["observe"])))
+
+    os.makedirs(output, exist_ok=True)
+    path = os.path.join(output, f"{study['name']}.npz")
+    np.savez(path,
+             study=np.array(json.dumps(study)),
+             **columns,
+             **dict(zip(study["observe"], results.T)))
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the studies of a JSON or TOML config file")
+    parser.add_argument("config")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default="./results")
+    parser.add_argument("--cache", default="./.cache")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--dry-run",
+                        action="store_true",
+                        help="only list the studies and their task counts")
+    args = parser.parse_args(argv)
+
+    studies = load_studies(args.config)
+    if args.dry_run:
+        for study in studies:
+            print(f"{study['name']}: {len(expand(study)[0])} tasks")
+        return 0
+
+    cache = None if args.no_cache else ResultCache(args.cache)
+    for study in studies:
+        print(run_study(study, args.output, args.workers, cache))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from src.backends import BACKENDS
+from src.instrument import instrument
+from src.model import NSModel
+from src.zipper import Zipper
+
+MODELS = {"NSModel": NSModel, "Zipper": Zipper}
+
+# Scaling curves vary one parameter at a time around the base case
+BASE = {
+    "n_lanes": 3,
+    "lane_len": 1000,
+    "lane_density": 0.3,
+    "lane_changes": True,
+}
+SWEEPS = {
+    "lane_len": [100, 1000, 10000],
+    "n_lanes": [1, 3, 6],
+    "lane_density": [0.1, 0.3, 0.6],
+    "lane_changes": [False, True],
+    "n_blocked": [0, 1, 2],
+}
+PHASES = ["step", "lanes", "velocity", "position", "merge"]
+
+
+def cases(models=MODELS, quick=False):
+    # (model name, params, phases) triples without duplicates of the base
+    # case; the phases are only broken down on the base case
+    seen = set()
+    for name, cls in models.items():
+        base = dict(BASE, lane_len=200) if quick else BASE
+        grids = [(parameter, values) for parameter, values in SWEEPS.items()
+                 if parameter != "n_blocked" or issubclass(cls, Zipper)]
+        phases = PHASES if issubclass(cls, Zipper) else PHASES[:-1]
+        for parameter, values in grids:
+            for value in values[:2] if quick else values:
+                params = dict(base, **{parameter: value})
+                key = (name, tuple(sorted(params.items())))
+                if key not in seen:
+                    seen.add(key)
+                    yield name, params, phases if params == base else ["step"]
+
+
+def timed_steps(model, n_steps):
+    # Per-phase times of n_steps steps, from the model's instrumentation
+    instrumentation = model.instrumentation
+    instrumentation.reset()
+    for _ in range(n_steps):
+        model.simulate()
+    totals = dict(instrumentation.times)
+    totals["step"] = sum(totals.values())
+    return totals
+
+
+def time_phases(model, min_time=0.2, repeats=3):
+    # Best time per step of every phase over `repeats` rounds, each long
+    # enough to last at least min_time, so fast and slow backends are both
+    # measured reliably
+    instrument(model, counters=False)
+    timed_steps(model, 1)
+    n_steps = 1
+    while timed_steps(model, n_steps)["step"] < min_time:
+        n_steps *= 2
+
+    best = {phase: np.inf for phase in PHASES}
+    for _ in range(repeats):
+        totals = timed_steps(model, n_steps)
+        for phase in PHASES:
+            best[phase] = min(best[phase], totals[phase] / n_steps)
+    return best, n_steps
+
+
+def run_case(name, params, backend, phases=("step", ), seed=0, min_time=0.2,
+             repeats=3):
+    model = MODELS[name](backend=backend, seed=seed, **params)
+    seconds, n_steps = time_phases(model, min_time, repeats)
+    cells = model.n_lanes * model.lane_len
+    cars = model.car_count()
+    return [{
+        "key": case_key(name, backend, phase, params),
+        "model": name,
+        "backend": backend,
+        "phase": phase,
+        "params": params,
+        "steps": n_steps,
+        "seconds_per_step": seconds[phase],
+        "cell_updates_per_s": cells / seconds[phase],
+        "car_updates_per_s": cars / seconds[phase],
+    } for phase in phases if seconds[phase]]
+
+
+def case_key(name, backend, phase, params):
+    values = ",".join(f"{k}={v}" for k, v in sorted(params.items()))
+    return f"{name}/{backend}/{phase}/{values}"
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True,
+                              text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(backends=None,
+              models=MODELS,
+              quick=False,
+              seed=0,
+              min_time=0.2,
+              repeats=3,
+              stream=sys.stderr):
+    backends = backends or sorted(BACKENDS)
+    results = []
+    for backend in backends:
+        for name, params, phases in cases(models, quick):
+            for result in run_case(name, params, backend, phases, seed,
+                                   min_time, repeats):
+                results.append(result)
+                if stream:
+                    stream.write(
+                        f"{result['key']:90} "
+                        f"{result['cell_updates_per_s']:12.3e} cells/s "
+                        f"{result['car_updates_per_s']:12.3e} cars/s\n")
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_run(path, run):
+    history = load_history(path)
+    history.append(run)
+    with open(path, "w") as file:
+        json.dump(history, file, indent=1)
+
+
+def compare(run, baseline, threshold=0.1):
+    # Cases whose cell throughput fell by more than `threshold` relative to
+    # the baseline run, as (key, baseline, current, relative change)
+    before = {result["key"]: result for result in baseline["results"]}
+    regressions = []
+    for result in run["results"]:
+        if result["key"] not in before:
+            continue
+        old = before[result["key"]]["cell_updates_per_s"]
+        new = result["cell_updates_per_s"]
+        change = new / old - 1
+        if change < -threshold:
+            regressions.append((result["key"], old, new, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Step throughput of NSModel and Zipper")
+    parser.add_argument("--backend", action="append", choices=BACKENDS)
+    parser.add_argument("--model", action="append", choices=MODELS)
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--history", default="benchmarks.json")
+    parser.add_argument("--compare",
+                        action="store_true",
+                        help="compare with the last run in the history")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    models = {name: MODELS[name] for name in args.model or MODELS}
+    run = run_suite(args.backend, models, args.quick, 0, args.min_time,
+                    args.repeats)
+
+    regressions = []
+    history = load_history(args.history)
+    if args.compare and history:
+        regressions = compare(run, history[-1], args.threshold)
+        for key, old, new, change in regressions:
+            print(f"REGRESSION {key}: {old:.3e} -> {new:.3e} cells/s "
+                  f"({change:+.1%})")
+        if not regressions:
+            print(f"No regressions beyond {args.threshold:.0%} against "
+                  f"{history[-1]['revision'] or history[-1]['time']}")
+    if not args.no_save:
+        save_run(args.history, run)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
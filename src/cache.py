@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from src.backends import BACKEND_ENV
+
+SOURCE_DIR = Path(__file__).resolve().parent
+
+
+def canonical(value):
+    # JSON-able form of task parameters: classes and functions by qualified
+    # name, numpy scalars and arrays as plain numbers and lists
+    if isinstance(value, dict):
+        return {str(k): canonical(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [canonical(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return canonical(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, type) or callable(value):
+        return f"{value.__module__}.{value.__qualname__}"
+    return value
+
+
+def digest(value):
+    return hashlib.sha256(
+        json.dumps(canonical(value), sort_keys=True).encode()).hexdigest()
+
+
+# Modules whose code decides the cached results: the models, their step
+# kernels and the per-task functions. Changing plots, titles or the run
+# machinery keeps the cache.
+RESULT_MODULES = ["model", "zipper", "vectorized", "backends", "jit",
+                  "sparse", "ensemble", "observables", "points"]
+
+_code_version = None
+
+
+def code_version():
+    # Hash of the modules behind the results, so any change to the
+    # simulation code invalidates cached points
+    global _code_version
+    if _code_version is None:
+        sha = hashlib.sha256()
+        for name in RESULT_MODULES:
+            path = SOURCE_DIR / f"{name}.py"
+            sha.update(path.name.encode())
+            sha.update(path.read_bytes())
+        _code_version = sha.hexdigest()
+    return _code_version
+
+
+class ResultCache:
+    # Per-task results on disk, one .npy file per content hash of (function,
+    # task parameters, seed, code version, backend). Reads refresh a file's
+    # modification time and writes evict the least recently used files once
+    # the cache outgrows max_bytes.
+    def __init__(self, path="./.cache", max_bytes=1 << 30):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.total = None
+
+    def key(self, fn, task, seed, occurrence=0):
+        return digest({
+            "fn": fn,
+            "task": task,
+            "seed": seed,
+            "occurrence": occurrence,
+            "code": code_version(),
+            "backend": os.environ.get(BACKEND_ENV),
+        })
+
+    def file(self, key):
+        return self.path / key[:2] / f"{key}.npy"
+
+    def checkpoint(self, key):
+        # Where a task that has not finished yet keeps its latest snapshot
+        directory = self.path / "checkpoints"
+        directory.mkdir(exist_ok=True)
+        return str(directory / f"{key}.npz")
+
+    def get(self, key):
+        # The cached result, or None
+        file = self.file(key)
+        try:
+            value = np.load(file, allow_pickle=False)
+        except (OSError, ValueError):
+            return None
+        os.utime(file)
+        return value.item() if value.ndim == 0 else value
+
+    def put(self, key, value):
+        file = self.file(key)
+        file.parent.mkdir(exist_ok=True)
+        temporary = file.with_suffix(f".{os.getpid()}.tmp")
+        with open(temporary, "wb") as handle:
+            np.save(handle, np.asarray(value), allow_pickle=False)
+        os.replace(temporary, file)
+
+        if self.total is None:
+            self.total = self.size()
+        else:
+            self.total += file.stat().st_size
+        if self.max_bytes < self.total:
+            self.evict()
+
+    def files(self):
+        return list(self.path.glob("*/*.npy"))
+
+    def size(self):
+        return sum(file.stat().st_size for file in self.files())
+
+    def evict(self):
+        entries = []
+        for file in self.files():
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, file))
+        total = sum(size for _, size, _ in entries)
+        for _, size, file in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            file.unlink(missing_ok=True)
+            total -= size
+        self.total = total
+
+    def clear(self):
+        for file in self.files():
+            file.unlink(missing_ok=True)
+        self.total = 0
@@ -0,0 +1,134 @@
+import json
+import os
+
+import numpy as np
+
+from src import vectorized
+from src.ensemble import Ensemble
+from src.model import NSModel
+from src.recorder import wrap_simulate
+from src.sparse import SparseNSModel, SparseZipper
+from src.zipper import Zipper
+
+MODELS = {
+    cls.__name__: cls
+    for cls in (NSModel, Zipper, SparseNSModel, SparseZipper, Ensemble)
+}
+
+# Constructor arguments saved with the state of each kind of model
+PARAMS = ["prob", "n_lanes", "lane_len", "max_velocity", "lane_density",
+          "lane_changes"]
+ZIPPER_PARAMS = ["n_blocked", "portion_blocked"]
+ENSEMBLE_PARAMS = ["replicas"]
+
+
+def model_params(model):
+    names = PARAMS
+    if isinstance(model, Zipper):
+        names = names + ZIPPER_PARAMS
+    if isinstance(model, Ensemble):
+        names = names + ENSEMBLE_PARAMS
+    return {
+        name: np.asarray(getattr(model, name)).tolist()
+        for name in names
+    }
+
+
+def save_checkpoint(model, path, **extra):
+    # Writes the model's road, flow count, blockages and generator state,
+    # plus any extra arrays (e.g. progress of the caller), to one compressed
+    # .npz file. The file is replaced atomically, so a run killed while
+    # saving leaves the previous checkpoint intact.
+    state = {
+        "model": type(model).__name__,
+        "params": model_params(model),
+        "rng": model.rng.bit_generator.state,
+        "backend": getattr(getattr(model, "backend", None), "name", None),
+    }
+    arrays = {
+        "state": np.array(json.dumps(state)),
+        "highway": np.asarray(model.highway, dtype=np.int8),
+        "flow_count": np.asarray(model.flow_count),
+    }
+    if isinstance(model, Zipper):
+        lanes = sorted(model.blockages)
+        arrays["blocked_lanes"] = np.array(lanes, dtype=int)
+        for lane in lanes:
+            arrays[f"blockage_{lane}"] = np.asarray(model.blockages[lane])
+    for name, value in extra.items():
+        arrays[f"extra_{name}"] = np.asarray(value)
+
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        np.savez_compressed(file, **arrays)
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path):
+    # The model saved at path and a dict of the extra arrays saved with it
+    with np.load(path, allow_pickle=False) as data:
+        state = json.loads(data["state"].item())
+        cls = MODELS[state["model"]]
+        params = state["params"]
+        if cls is not Ensemble:
+            params["backend"] = state["backend"]
+        model = cls(**params)
+
+        highway = data["highway"].astype(np.int8)
+        if isinstance(model, Zipper):
+            model.blockages = {
+                int(lane): data[f"blockage_{lane}"]
+                for lane in data["blocked_lanes"]
+            }
+        model.highway = highway
+        if hasattr(model, "block_distance"):
+            model.block_distance, model.can_merge = \
+                vectorized.blockage_index(highway)
+        model.flow_count = data["flow_count"].copy() if isinstance(
+            model, Ensemble) else int(data["flow_count"])
+        model.rng.bit_generator.state = state["rng"]
+
+        extra = {
+            name[len("extra_"):]: data[name]
+            for name in data.files if name.startswith("extra_")
+        }
+    return model, extra
+
+
+class Checkpointer:
+    # Saves a checkpoint of the model every `every` steps it simulates,
+    # together with the number of steps taken. Attach it like a
+    # TrajectoryRecorder; resume() picks up a run from its last checkpoint.
+    def __init__(self, path, every=100):
+        self.path = path
+        self.every = every
+        self.step = 0
+        self.model = None
+        self.unwrap = None
+
+    def attach(self, model, step=0):
+        self.model = model
+        self.step = step
+        self.unwrap = wrap_simulate(model, self.after_step)
+        return self
+
+    def detach(self):
+        if self.model is not None:
+            self.unwrap()
+            self.model = None
+
+    def after_step(self, model):
+        self.step += 1
+        if self.step % self.every == 0:
+            self.save()
+
+    def save(self):
+        save_checkpoint(self.model, self.path, step=self.step)
+
+    def resume(self, model=None):
+        # The model and step count of the last checkpoint, or the given
+        # fresh model at step 0 when there is none yet, attached either way
+        if os.path.exists(self.path):
+            model, extra = load_checkpoint(self.path)
+            return self.attach(model, int(extra["step"])).model, self.step
+        return self.attach(model).model, 0
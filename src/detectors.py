@@ -0,0 +1,125 @@
+import numpy as np
+
+# Readings of every bin, one column per loop or section
+LOOP_FIELDS = ["loop_flow", "loop_occupancy", "loop_speed"]
+SECTION_FIELDS = ["section_density", "section_speed"]
+
+
+class Detectors:
+    # Virtual sensors read every step the model simulates and summed over
+    # bins of bin_steps steps. Loops, given as (lane, cell), count the cars
+    # entering the cell during the step and their speed, and whether a car
+    # stands on the cell after it; a loop at cell 0 counts what flow_count
+    # does. Sections, given as (lane, start, end) with lane None for all
+    # lanes, measure the density and space-mean speed over cells start to
+    # end - 1. Attach to an NSModel, Zipper or their sparse variants.
+    def __init__(self, loops=(), sections=(), bin_steps=10):
+        self.loops = np.array(loops, dtype=int).reshape(-1, 2)
+        self.sections = np.array([(-1 if lane is None else lane, start, end)
+                                  for lane, start, end in sections],
+                                 dtype=int).reshape(-1, 3)
+        self.bin_steps = bin_steps
+        self.model = None
+        self.reset()
+
+    def attach(self, model):
+        self.model = model
+        model.detectors = self
+        return self
+
+    def detach(self):
+        if self.model is not None:
+            self.model.detectors = None
+            self.model = None
+
+    def reset(self):
+        self.step = 0
+        self.bins = {name: [] for name in LOOP_FIELDS + SECTION_FIELDS}
+        self.crossings = np.zeros(len(self.loops), dtype=int)
+        self.speeds = np.zeros(len(self.loops), dtype=int)
+        self.occupied = np.zeros(len(self.loops), dtype=int)
+        self.cars = np.zeros(len(self.sections), dtype=int)
+        self.velocity = np.zeros(len(self.sections), dtype=int)
+
+    def observe(self, before, after):
+        # Called by the model with its road before the position update and
+        # after the whole step
+        n_lanes, lane_len = after.shape
+        lanes, cells = np.nonzero(0 <= before)
+        velocity = before[lanes, cells].astype(int)
+
+        # Zipper cars held in front of a blockage keep their cell
+        ahead = (cells + np.maximum(velocity, 1)) % lane_len
+        moves = np.where(before[lanes, ahead] == -2, 0, velocity)
+
+        if len(self.loops):
+            # Every car enters the cells cell + 1 to cell + moves. Marking
+            # those ranges on lanes of 2 * lane_len cells, so that moves past
+            # the end need no wrapping, and summing the marks gives the
+            # entries of every cell at once.
+            size = 2 * lane_len + 1
+            starts = lanes * size + cells + 1
+            ends = starts + moves
+            n_cells = n_lanes * size
+            entries = np.cumsum(
+                np.bincount(starts, minlength=n_cells) -
+                np.bincount(ends, minlength=n_cells)).reshape(n_lanes, size)
+            speeds = np.cumsum(
+                np.bincount(starts, velocity, n_cells) -
+                np.bincount(ends, velocity, n_cells)).reshape(n_lanes, size)
+
+            lane, cell = self.loops.T
+            self.crossings += entries[lane, cell] + entries[lane,
+                                                            cell + lane_len]
+            self.speeds += np.rint(speeds[lane, cell] +
+                                   speeds[lane, cell + lane_len]).astype(int)
+            self.occupied += 0 <= after[lane, cell]
+
+        if len(self.sections):
+            # Running sums along every lane, plus a row for all lanes
+            # together
+            cars = np.zeros((n_lanes + 1, lane_len + 1), dtype=int)
+            np.cumsum(0 <= after, axis=1, out=cars[:n_lanes, 1:])
+            cars[n_lanes] = cars[:n_lanes].sum(axis=0)
+            speed = np.zeros((n_lanes + 1, lane_len + 1), dtype=int)
+            np.cumsum(np.maximum(after, 0), axis=1, out=speed[:n_lanes, 1:])
+            speed[n_lanes] = speed[:n_lanes].sum(axis=0)
+
+            lane, start, end = self.sections.T
+            row = np.where(lane < 0, n_lanes, lane)
+            self.cars += cars[row, end] - cars[row, start]
+            self.velocity += speed[row, end] - speed[row, start]
+
+        self.step += 1
+        if self.step % self.bin_steps == 0:
+            self.close_bin(n_lanes)
+
+    def close_bin(self, n_lanes):
+        steps = self.bin_steps
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.bins["loop_flow"].append(self.crossings / steps)
+            self.bins["loop_occupancy"].append(self.occupied / steps)
+            self.bins["loop_speed"].append(self.speeds / self.crossings)
+
+            lane, start, end = self.sections.T
+            cells = (end - start) * np.where(lane < 0, n_lanes, 1)
+            self.bins["section_density"].append(self.cars / (steps * cells))
+            self.bins["section_speed"].append(self.velocity / self.cars)
+
+        for counts in (self.crossings, self.speeds, self.occupied, self.cars,
+                       self.velocity):
+            counts.fill(0)
+
+    def results(self):
+        # Readings of the finished bins as (bins, loops) and (bins, sections)
+        # arrays: flow in cars per step, occupancy as the fraction of steps
+        # the loop cell is taken, speeds in cells per step (nan for bins
+        # without cars) and density in cars per cell
+        n_columns = {name: len(self.loops) for name in LOOP_FIELDS}
+        n_columns.update(
+            {name: len(self.sections)
+             for name in SECTION_FIELDS})
+        return {
+            name: np.array(values).reshape(len(values), n_columns[name])
+            for name, values in self.bins.items()
+        }
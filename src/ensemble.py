@@ -0,0 +1,119 @@
+import numpy as np
+
+from src import vectorized
+from src.observables import advance
+
+
+class Ensemble:
+    # R independent NSModel replicas stacked into one (R, lanes, len) grid.
+    # prob, max_velocity and lane_density may be scalars or one value per
+    # replica.
+    def __init__(self,
+                 replicas=1,
+                 prob=0.5,
+                 n_lanes=3,
+                 lane_len=100,
+                 max_velocity=5,
+                 lane_density=0.3,
+                 lane_changes=False,
+                 seed=None):
+        self.replicas = replicas
+        self.prob = np.broadcast_to(np.asarray(prob, dtype=float),
+                                    (replicas, ))
+        self.n_lanes = n_lanes
+        self.lane_len = lane_len
+        self.max_velocity = np.broadcast_to(
+            np.asarray(max_velocity, dtype=int), (replicas, ))
+        self.lane_density = np.broadcast_to(
+            np.asarray(lane_density, dtype=float), (replicas, ))
+        self.lane_changes = lane_changes
+        self.rng = np.random.default_rng(seed)
+        self.flow_count = np.zeros(replicas, dtype=int)
+        self.initialize_highway()
+
+    def simulate(self):
+        # Advances every replica by one step and returns the per-replica flow
+        # of this step and mean velocity after it.
+        flow = self.step()
+        return flow, self.highway_velocity()
+
+    def step(self):
+        # simulate() without the velocities, returning the per-replica flow
+        bits = None
+        if self.lane_changes:
+            bits = vectorized.occupancy_bits(
+                self.highway.reshape(-1, self.lane_len))
+            vectorized.update_lanes(self.highway, self.prob[:, None],
+                                    self.max_velocity[:, None], self.rng,
+                                    bits)
+        vectorized.update_velocity(self.highway, self.prob[:, None],
+                                   self.max_velocity[:, None], self.rng, bits)
+        updated, flow = vectorized.update_position(self.highway,
+                                                   out=self.spare)
+        self.spare, self.highway = self.highway, updated
+        flow = flow.sum(axis=1)
+        self.flow_count += flow
+        return flow
+
+    def advance(self, n_steps, observe=("velocity", ), every=1, out=None):
+        # Per-replica counterpart of NSModel.advance, one column per replica
+        return advance(self, n_steps, observe, every, out)
+
+    def spawn(self, n_children):
+        return self.rng.spawn(n_children)
+
+    def car_count(self):
+        return np.count_nonzero(0 <= self.highway, axis=(1, 2))
+
+    def lane_velocity(self):
+        cars = 0 <= self.highway
+        total = np.where(cars, self.highway, 0).sum(axis=2)
+        count = cars.sum(axis=2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return total / count
+
+    def highway_velocity(self):
+        return self.lane_velocity().mean(axis=1)
+
+    def highway_structure(self):
+        return -1 * np.ones((self.replicas, self.n_lanes, self.lane_len),
+                            dtype=np.int8)
+
+    def populate_highway(self):
+        n_cars = (self.lane_len * self.lane_density).astype(int)
+        shape = (self.replicas, self.n_lanes, self.lane_len)
+
+        # Ranking random keys picks n_cars distinct cells in every lane
+        rank = self.rng.random(shape).argsort(axis=2).argsort(axis=2)
+        cars = rank < n_cars[:, None, None]
+        velocity = self.rng.integers(0,
+                                     self.max_velocity[:, None, None] + 1,
+                                     size=shape)
+        self.highway[cars] = velocity[cars]
+
+    def set_density(self, lane_density):
+        # Per-replica counterpart of NSModel.set_density
+        self.lane_density = np.broadcast_to(
+            np.asarray(lane_density, dtype=float), (self.replicas, ))
+        n_cars = (self.lane_len * self.lane_density).astype(int)[:, None,
+                                                                  None]
+        shape = self.highway.shape
+        cars = 0 <= self.highway
+        count = cars.sum(axis=2, keepdims=True)
+
+        keys = self.rng.random(shape)
+        car_rank = np.where(cars, keys, 2).argsort(axis=2).argsort(axis=2)
+        empty_rank = np.where(cars, 2, keys).argsort(axis=2).argsort(axis=2)
+        remove = cars & (n_cars <= car_rank)
+        add = ~cars & (empty_rank < n_cars - count)
+
+        velocity = self.rng.integers(0,
+                                     self.max_velocity[:, None, None] + 1,
+                                     size=shape)
+        self.highway[remove] = -1
+        self.highway[add] = velocity[add]
+
+    def initialize_highway(self):
+        self.highway = self.highway_structure()
+        self.spare = np.empty_like(self.highway)
+        self.populate_highway()
@@ -0,0 +1,170 @@
+import sys
+
+import numpy as np
+
+from src.backends import BACKENDS, get_backend
+from src.model import NSModel
+from src.sparse import SparseNSModel, SparseZipper
+from src.zipper import Zipper
+
+# Equivalence of step backends against the reference Python loops, with and
+# without lane changes. The sparse models bring their own kernels whatever
+# the backend, so they are checked as one more backend, SPARSE, standing
+# for the sparse variant of each scenario's model.
+SPARSE = "sparse"
+SPARSE_MODELS = {NSModel: SparseNSModel, Zipper: SparseZipper}
+SCENARIOS = [
+    ("NSModel", NSModel, {}),
+    ("Zipper", Zipper, {
+        "n_blocked": 1
+    }),
+]
+DENSITIES = [0.1, 0.3, 0.6]
+
+
+def make_model(cls, backend, **params):
+    if backend == SPARSE:
+        return SPARSE_MODELS[cls](**params)
+    return cls(backend=backend, **params)
+
+
+def sample(cls, backend, seeds, steps=300, warmup=100, **params):
+    # Time-averaged mean velocity over all cars (a blocked lane may empty
+    # out) and flow per step of one run per seed
+    velocity, flow = [], []
+    for seed in seeds:
+        model = make_model(cls, backend, seed=seed, **params)
+        for _ in range(warmup):
+            model.simulate()
+        flow_count = model.flow_count
+        values = []
+        for _ in range(steps):
+            model.simulate()
+            highway = model.highway
+            values.append(highway[0 <= highway].mean())
+        velocity.append(np.mean(values))
+        flow.append((model.flow_count - flow_count) / steps)
+    return np.array(velocity), np.array(flow)
+
+
+def ks_statistic(a, b):
+    values = np.sort(np.concatenate((a, b)))
+    cdf_a = np.searchsorted(np.sort(a), values, side="right") / len(a)
+    cdf_b = np.searchsorted(np.sort(b), values, side="right") / len(b)
+    return np.abs(cdf_a - cdf_b).max()
+
+
+def same_distribution(a, b, c_alpha=1.95, z=4):
+    # Two-sample KS test at alpha = 0.001 plus a z-test on the means
+    critical = c_alpha * np.sqrt((len(a) + len(b)) / (len(a) * len(b)))
+    error = np.sqrt(a.var(ddof=1) / len(a) + b.var(ddof=1) / len(b))
+    return (ks_statistic(a, b) <= critical
+            and abs(a.mean() - b.mean()) <= z * error + 1e-9)
+
+
+def check_exact(backend, steps=100, seeds=range(5)):
+    # Without slowdown or lane changes the dynamics are deterministic, so
+    # every backend must reproduce the reference grid cell for cell.
+    for name, cls, params in SCENARIOS:
+        for density in DENSITIES:
+            for seed in seeds:
+                reference = cls(prob=0.0,
+                                lane_density=density,
+                                lane_changes=False,
+                                backend="python",
+                                seed=seed,
+                                **params)
+                model = make_model(cls,
+                                   backend,
+                                   prob=0.0,
+                                   lane_density=density,
+                                   lane_changes=False,
+                                   seed=seed,
+                                   **params)
+                if backend == SPARSE:
+                    # The sparse models place their cars differently for
+                    # the same seed, so they start from the reference road
+                    model.highway = reference.highway.copy()
+                for _ in range(steps):
+                    reference.simulate()
+                    model.simulate()
+                if not ((reference.highway == model.highway).all() and
+                        reference.flow_count == model.flow_count):
+                    return False, f"{name} density={density} seed={seed}"
+    return True, ""
+
+
+def check_lanes(backend, steps=50, seeds=range(5)):
+    # Every backend draws the lane change uniforms in the same order, so
+    # from the same road and generator state the lane phase must match the
+    # reference cell for cell.
+    kernels = get_backend(backend)
+    for name, cls, params in SCENARIOS:
+        for density in DENSITIES:
+            for seed in seeds:
+                model = cls(n_lanes=3,
+                            lane_density=density,
+                            lane_changes=True,
+                            backend=backend,
+                            seed=seed,
+                            **params)
+                for step in range(steps):
+                    highway = model.highway.copy()
+                    state = model.rng.bit_generator.state
+                    expected = model.update_lanes()
+                    reference = model.highway
+                    model.highway = highway
+                    model.rng.bit_generator.state = state
+                    changes = kernels.update_lanes(model)
+                    if not ((reference == model.highway).all()
+                            and expected == changes):
+                        return False, (f"{name} density={density} "
+                                       f"seed={seed} step={step}")
+                    model.simulate()
+    return True, ""
+
+
+def check_statistics(backend, replicas=16, steps=300, warmup=100):
+    failures = []
+    seeds = np.random.SeedSequence(2021).spawn(replicas)
+    for name, cls, params in SCENARIOS:
+        for lane_changes in (False, True):
+            for density in DENSITIES:
+                run_params = dict(params,
+                                  n_lanes=2,
+                                  lane_len=100,
+                                  lane_density=density,
+                                  lane_changes=lane_changes,
+                                  steps=steps,
+                                  warmup=warmup)
+                expected = sample(cls, "python", seeds, **run_params)
+                actual = sample(cls, backend, seeds, **run_params)
+                for observable, a, b in zip(("velocity", "flow"), expected,
+                                            actual):
+                    if not same_distribution(a, b):
+                        failures.append(
+                            f"{name} lane_changes={lane_changes} "
+                            f"density={density} {observable}: "
+                            f"{a.mean():.3f} vs {b.mean():.3f}")
+    return not failures, "; ".join(failures)
+
+
+def check_equivalence(backends=None):
+    backends = backends or [name for name in BACKENDS if name != "python"
+                            ] + [SPARSE]
+    passed = True
+    for backend in backends:
+        # The sparse models draw the lane change uniforms lane by lane, so
+        # their lane phase matches the reference only in distribution
+        checks = (check_exact, check_statistics) if backend == SPARSE else (
+            check_exact, check_lanes, check_statistics)
+        for check in checks:
+            ok, detail = check(backend)
+            passed &= ok
+            print(f"{backend:8} {check.__name__:18} "
+                  f"{'ok' if ok else 'FAILED ' + detail}")
+    return passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_equivalence(sys.argv[1:]) else 1)
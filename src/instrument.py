@@ -0,0 +1,121 @@
+import time
+
+import numpy as np
+
+PHASES = ["lanes", "velocity", "position", "merge"]
+COUNTERS = ["lane_attempts", "lane_changes", "merges", "braking", "flow"]
+
+
+class Instrumentation:
+    # Per-phase timers, step counters and pre/post-step hooks for an NSModel
+    # or Zipper. Set as model.instrumentation (see instrument()); while it
+    # is None the model steps without any of this. Hooks are called with the
+    # model. With `series` every step's timings and counts are kept as well
+    # as the totals.
+    def __init__(self, timers=True, counters=True, series=False):
+        self.timers = timers
+        self.counters = counters
+        self.keep_series = series
+        self.pre_step = []
+        self.post_step = []
+        self.reset()
+
+    def reset(self):
+        self.steps = 0
+        self.times = dict.fromkeys(PHASES, 0.0)
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.history = {name: [] for name in PHASES + COUNTERS}
+
+    def step(self, model):
+        for hook in self.pre_step:
+            hook(model)
+
+        clock = time.perf_counter if self.timers else _no_clock
+        backend = model.backend
+        times = dict.fromkeys(PHASES, 0.0)
+        counts = dict.fromkeys(COUNTERS, 0)
+
+        start = clock()
+        if model.lane_changes:
+            counts["lane_attempts"], counts["lane_changes"] = \
+                backend.update_lanes(model)
+        times["lanes"] = clock() - start
+
+        if self.counters:
+            before = model.highway
+            cars = 0 <= before
+            velocity = before[cars]
+        start = clock()
+        backend.update_velocity(model)
+        times["velocity"] = clock() - start
+        if self.counters:
+            counts["braking"] = int(
+                np.count_nonzero(model.highway[cars] < velocity))
+
+        detectors = getattr(model, "detectors", None)
+        moving = None if detectors is None else model.highway.copy()
+        flow_count = model.flow_count
+        start = clock()
+        backend.update_position(model)
+        times["position"] = clock() - start
+        counts["flow"] = int(model.flow_count - flow_count)
+
+        start = clock()
+        counts["merges"] = backend.merge_cars(model)
+        times["merge"] = clock() - start
+        if detectors is not None:
+            detectors.observe(moving, model.highway)
+
+        self.steps += 1
+        for name in PHASES:
+            self.times[name] += times[name]
+        for name in COUNTERS:
+            self.counts[name] += counts[name]
+        if self.keep_series:
+            for name in PHASES:
+                self.history[name].append(times[name])
+            for name in COUNTERS:
+                self.history[name].append(counts[name])
+
+        for hook in self.post_step:
+            hook(model)
+
+    def on_pre_step(self, hook):
+        self.pre_step.append(hook)
+        return hook
+
+    def on_post_step(self, hook):
+        self.post_step.append(hook)
+        return hook
+
+    def summary(self):
+        # Rows of (name, total, per step) for every timer and counter
+        steps = max(self.steps, 1)
+        rows = []
+        if self.timers:
+            rows += [(f"{name} time (s)", self.times[name],
+                      self.times[name] / steps) for name in PHASES]
+        rows += [(name, self.counts[name], self.counts[name] / steps)
+                 for name in COUNTERS]
+        return rows
+
+    def table(self):
+        lines = [f"{'':20}{'total':>14}{'per step':>14}"]
+        for name, total, per_step in self.summary():
+            lines.append(f"{name:20}{total:14.6g}{per_step:14.6g}")
+        lines.append(f"{'steps':20}{self.steps:14d}")
+        return "\n".join(lines)
+
+    def series(self):
+        # Per-step arrays of every timer and counter (requires series=True)
+        return {name: np.array(values) for name, values in self.history.items()}
+
+
+def _no_clock():
+    return 0.0
+
+
+def instrument(model, timers=True, counters=True, series=False):
+    # Attaches a new Instrumentation to the model and returns it
+    model.instrumentation = Instrumentation(timers, counters, series)
+    return model.instrumentation
@@ -0,0 +1,172 @@
+import numpy as np
+from numba import njit
+
+# Compiled counterparts of the kernels in src.vectorized. They follow the same
+# rules and consume the same uniforms in the same (row-major car) order, so
+# a run is identical to the numpy backend for the same seed.
+
+
+def per_row(value, highway, dtype):
+    return np.ascontiguousarray(
+        np.broadcast_to(np.asarray(value, dtype=dtype),
+                        highway.shape[:-1]).reshape(-1))
+
+
+@njit(cache=True)
+def distance_ahead(lane, pos):
+    lane_len = len(lane)
+    for distance in range(1, lane_len):
+        if lane[(pos + distance) % lane_len] != -1:
+            return distance
+    return lane_len
+
+
+@njit(cache=True)
+def distance_behind(lane, pos):
+    lane_len = len(lane)
+    for distance in range(1, lane_len):
+        if lane[(pos - distance) % lane_len] != -1:
+            return distance, (pos - distance) % lane_len
+    return lane_len, -1
+
+
+@njit(cache=True)
+def velocity_kernel(rows, prob, max_velocity, draws):
+    n_rows, lane_len = rows.shape
+    k = 0
+    for r in range(n_rows):
+        first = -1
+        for j in range(lane_len):
+            if rows[r, j] != -1:
+                first = j
+                break
+        if first < 0:
+            continue
+
+        j = first
+        while True:
+            following = j + 1
+            while following < lane_len and rows[r, following] == -1:
+                following += 1
+            ahead = first + lane_len if following == lane_len else following
+
+            if 0 <= rows[r, j]:
+                velocity = min(rows[r, j] + 1, max_velocity[r], ahead - j - 1)
+                if 1 <= velocity and draws[k] < prob[r]:
+                    velocity -= 1
+                rows[r, j] = velocity
+                k += 1
+
+            if following == lane_len:
+                break
+            j = following
+
+
+@njit(cache=True)
+def position_kernel(rows, hold, updated):
+    n_rows, lane_len = rows.shape
+    flow = np.zeros(n_rows, dtype=np.int64)
+    for r in range(n_rows):
+        for j in range(lane_len):
+            updated[r, j] = -2 if rows[r, j] == -2 else -1
+
+    for r in range(n_rows):
+        for j in range(lane_len):
+            velocity = rows[r, j]
+            if velocity < 0:
+                continue
+            target = j if hold[r, j] else j + velocity
+            if lane_len <= target:
+                flow[r] += 1
+            updated[r, target % lane_len] = velocity
+    return flow
+
+
+@njit(cache=True)
+def lanes_kernel(grid, prob, max_velocity, draws):
+    n_replicas, n_lanes, lane_len = grid.shape
+    before = grid.copy()
+    upward = np.zeros(grid.shape, dtype=np.bool_)
+    n_cars = draws.shape[1]
+    moves = np.empty((n_cars, 4), dtype=np.int64)
+    n_moves = 0
+    attempted = 0
+
+    k = 0
+    for b in range(n_replicas):
+        for i in range(n_lanes):
+            row = b * n_lanes + i
+            for j in range(lane_len):
+                velocity = before[b, i, j]
+                if velocity < 0:
+                    continue
+                draw = k
+                k += 1
+
+                new_lane = i - 1 if draws[1, draw] < 0.5 else i + 1
+                if (draws[0, draw] < prob[row] or prob[row] <= draws[2, draw]
+                        or new_lane < 0 or n_lanes <= new_lane):
+                    continue
+                attempted += 1
+                if before[b, new_lane, j] != -1:
+                    continue
+
+                behind, cell = distance_behind(before[b, new_lane], j)
+                follower = -1 if cell < 0 else before[b, new_lane, cell]
+                if 0 <= follower and behind <= min(follower + 1,
+                                                    max_velocity[row]):
+                    continue
+
+                reach = min(velocity + 1, max_velocity[row])
+                if min(reach,
+                       distance_ahead(before[b, new_lane], j) - 1) < min(
+                           reach,
+                           distance_ahead(before[b, i], j) - 1):
+                    continue
+
+                moves[n_moves, 0] = b
+                moves[n_moves, 1] = i
+                moves[n_moves, 2] = j
+                moves[n_moves, 3] = new_lane
+                n_moves += 1
+                if i < new_lane:
+                    upward[b, new_lane, j] = True
+
+    # When two cars aim at the same cell the one from the lower lane wins
+    accepted = 0
+    for m in range(n_moves):
+        b, i, j, new_lane = moves[m, 0], moves[m, 1], moves[m, 2], moves[m, 3]
+        if new_lane < i and upward[b, new_lane, j]:
+            continue
+        grid[b, new_lane, j] = before[b, i, j]
+        grid[b, i, j] = -1
+        accepted += 1
+    return attempted, accepted
+
+
+def update_velocity(highway, prob, max_velocity, rng):
+    rows = highway.reshape(-1, highway.shape[-1])
+    draws = rng.random(np.count_nonzero(0 <= rows))
+    velocity_kernel(rows, per_row(prob, highway, float),
+                    per_row(max_velocity, highway, np.int64), draws)
+
+
+def update_position(highway, hold=None, out=None):
+    rows = highway.reshape(-1, highway.shape[-1])
+    hold = np.zeros(rows.shape, dtype=bool) if hold is None else \
+        hold.reshape(rows.shape)
+    if out is None:
+        out = np.empty_like(highway)
+    flow = position_kernel(rows, hold, out.reshape(rows.shape))
+    return out, flow.reshape(highway.shape[:-1])
+
+
+def update_lanes(highway, prob, max_velocity, rng):
+    n_lanes, lane_len = highway.shape[-2:]
+    if n_lanes == 1:
+        return 0, 0
+
+    grid = highway.reshape(-1, n_lanes, lane_len)
+    draws = rng.random((3, np.count_nonzero(0 <= grid)))
+    return lanes_kernel(grid, per_row(prob, highway, float),
+                        per_row(max_velocity, highway, np.int64), draws)
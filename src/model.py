@@ -1,5 +1,7 @@
 import numpy as np
-import numpy.random as rand
+
+from src.backends import get_backend
+from src.observables import advance
 
 
 class NSModel:
@@ -10,14 +12,22 @@ class NSModel:
                  max_velocity=5,
                  lane_density=0.3,
                  lane_changes=True,
-                 initialize_highway=True):
+                 initialize_highway=True,
+                 backend=None,
+                 seed=None):
         self.prob = prob
         self.n_lanes = n_lanes
         self.lane_len = lane_len
         self.max_velocity = max_velocity
         self.lane_density = lane_density
         self.lane_changes = lane_changes
+        self.backend = get_backend(backend)
+        self.rng = np.random.default_rng(seed)
         self.flow_count = 0
+        # Optional src.instrument.Instrumentation; None keeps the plain step
+        self.instrumentation = None
+        # Optional src.detectors.Detectors, shown every move of the cars
+        self.detectors = None
 
         if initialize_highway:
             self.initialize_highway()
@@ -25,20 +35,38 @@ class NSModel:
         # self.print_highway()
 
     def simulate(self):
+        if self.instrumentation is not None:
+            self.instrumentation.step(self)
+            return
+
         if self.lane_changes:
-            self.update_lanes()
+            self.backend.update_lanes(self)
             # print("Lane Change")
             # self.print_highway()
 
-        self.update_velocity()
+        self.backend.update_velocity(self)
         # print("Velocity Change")
         # self.print_highway()
 
-        self.update_position()
+        moving = None if self.detectors is None else self.highway.copy()
+        self.backend.update_position(self)
+        self.backend.merge_cars(self)
+        if moving is not None:
+            self.detectors.observe(moving, self.highway)
         # print("Position Change")
         # self.print_highway()
         # print(self.car_count())
 
+    def advance(self, n_steps, observe=("velocity", ), every=1, out=None):
+        # n_steps steps in one call, sampling only the requested
+        # observables, see src.observables.advance
+        return advance(self, n_steps, observe, every, out)
+
+    def spawn(self, n_children):
+        # Independent child generators for parallel replicas, derived from
+        # this model's stream
+        return self.rng.spawn(n_children)
+
     def print_highway(self):
         for lane in self.highway:
             print(''.join('.' if p == -1 else '*' if p == -2 else str(p)
@@ -57,21 +85,49 @@ class NSModel:
         return self.lane_velocity().mean()
 
     def highway_structure(self):
-        return -1 * np.ones((self.n_lanes, self.lane_len), dtype=int)
+        return -1 * np.ones((self.n_lanes, self.lane_len), dtype=np.int8)
 
     def populate_highway(self):
         n_cars = int(self.lane_len * self.lane_density)
         for lane in range(0, self.n_lanes):
-            indices = rand.choice(self.lane_len, size=n_cars, replace=False)
-            for index in indices:
-                self.highway[lane,
-                             index] = rand.randint(0, self.max_velocity + 1)
+            indices = self.rng.choice(self.lane_len,
+                                      size=n_cars,
+                                      replace=False)
+            self.highway[lane,
+                         indices] = self.rng.integers(0,
+                                                      self.max_velocity + 1,
+                                                      size=n_cars)
 
     def initialize_highway(self):
         self.highway = self.highway_structure()
         self.populate_highway()
 
+    def set_density(self, lane_density):
+        # Moves an equilibrated road to a new density by removing random cars
+        # or adding cars at random empty cells, never on blocked ones.
+        self.lane_density = lane_density
+        n_cars = int(self.lane_len * lane_density)
+        highway = self.highway
+        for lane in highway:
+            cars = np.nonzero(0 <= lane)[0]
+            if n_cars < len(cars):
+                lane[self.rng.choice(cars,
+                                     size=len(cars) - n_cars,
+                                     replace=False)] = -1
+                continue
+
+            empty = np.nonzero(lane == -1)[0]
+            indices = self.rng.choice(empty,
+                                      size=min(n_cars - len(cars),
+                                               len(empty)),
+                                      replace=False)
+            lane[indices] = self.rng.integers(0,
+                                              self.max_velocity + 1,
+                                              size=len(indices))
+        self.highway = highway
+
     def update_velocity(self):
+        draws = self.rng.random(self.highway.shape)
         for i in range(0, self.n_lanes):
             for j in range(0, self.lane_len):
                 if self.highway[i, j] < 0:
@@ -79,7 +135,7 @@ class NSModel:
 
                 self.highway[i, j] = self.get_max_velocity(i, j)
 
-                if 1 <= self.highway[i, j] and rand.rand() < self.prob:
+                if 1 <= self.highway[i, j] and draws[i, j] < self.prob:
                     self.highway[i, j] -= 1
 
     def get_distance(self, lane, pos):
@@ -89,11 +145,19 @@ class NSModel:
             distance += 1
         return distance
 
+    def get_distance_behind(self, lane, pos):
+        distance = 1
+        while self.highway[lane, (pos - distance) %
+                           self.lane_len] == -1 and distance < self.lane_len:
+            distance += 1
+        return distance
+
     def will_crash(self, lane, pos):
-        distance = self.get_distance(lane, pos)
-        max_velocity = self.get_max_velocity(lane,
-                                             (pos - distance) % self.lane_len)
-        return distance <= max_velocity
+        # Whether the car behind pos could not stop short of it
+        distance = self.get_distance_behind(lane, pos)
+        follower = int(self.highway[lane, (pos - distance) % self.lane_len])
+        return 0 <= follower and distance <= min(follower + 1,
+                                                  self.max_velocity)
 
     def get_max_velocity(self, lane, pos):
         if self.highway[lane, pos] < 0:
@@ -116,40 +180,62 @@ class NSModel:
 
         for i in range(0, self.n_lanes):
             for j in range(0, self.lane_len):
-                if self.highway[i, j] < 0:
+                # Python ints, as j + velocity overflows the int8 grid
+                velocity = int(self.highway[i, j])
+                if velocity < 0:
                     continue
 
-                if self.lane_len <= j + self.highway[i, j]:
+                if self.lane_len <= j + velocity:
                     self.flow_count += 1
 
-                updated_highway[i, (j + self.highway[i, j]) %
-                                self.lane_len] = self.highway[i, j]
+                updated_highway[i, (j + velocity) % self.lane_len] = velocity
 
         self.highway = updated_highway
 
+    def merge_cars(self):
+        # Plain roads have no blockages to merge around
+        return 0
+
     def update_lanes(self):
+        # Every car decides from the road before the phase, in the order and
+        # with the draws of the vectorized backends. Returns the number of
+        # lane changes attempted and made.
         if self.n_lanes == 1:
-            return
-
-        for i in range(0, self.n_lanes):
-            for j in range(0, self.lane_len):
-                if rand.rand() < self.prob or self.highway[i, j] == -2:
-                    continue
-
-                direction = -1 if rand.rand() < 0.5 else 1
-                if self.can_switch_lane(
-                        direction, i,
-                        j) and rand.rand() < self.prob and self.highway[
-                            (i + direction) % self.n_lanes, j] != -2:
-                    self.highway[(i + direction) % self.n_lanes,
-                                 j] = self.highway[i, j]
-                    self.highway[i, j] = -1
+            return 0, 0
+
+        lanes, cells = np.nonzero(0 <= self.highway)
+        draws = self.rng.random((3, len(lanes)))
+        attempted = 0
+        moves = {}
+        for k, (i, j) in enumerate(zip(lanes, cells)):
+            if draws[0, k] < self.prob or self.prob <= draws[2, k]:
+                continue
+
+            direction = -1 if draws[1, k] < 0.5 else 1
+            if not 0 <= i + direction < self.n_lanes:
+                continue
+
+            attempted += 1
+            if self.can_switch_lane(direction, i, j):
+                # Cars come lane by lane, so a car moving up from the lane
+                # below takes the cell before one moving down can
+                moves.setdefault((i + direction, j), i)
+
+        for (new_lane, j), i in moves.items():
+            self.highway[new_lane, j] = self.highway[i, j]
+            self.highway[i, j] = -1
+        return attempted, len(moves)
 
     def can_switch_lane(self, direction=0, lane=0, pos=0):
+        # The cell beside must be free, the car behind it must be able to
+        # stop in time and the move must not lower the speed the car can
+        # reach
         new_lane = lane + direction
         if (direction == 0 or new_lane < 0 or self.n_lanes <= new_lane
-                or 0 <= self.highway[new_lane, pos]
-                or self.will_crash(new_lane, pos) or self.get_max_velocity(
-                    new_lane, pos) > self.get_max_velocity(lane, pos)):
+                or self.highway[new_lane, pos] != -1
+                or self.will_crash(new_lane, pos)):
             return False
-        return True
+
+        reach = min(int(self.highway[lane, pos]) + 1, self.max_velocity)
+        return min(reach, self.get_distance(new_lane, pos) - 1) >= min(
+            reach, self.get_distance(lane, pos) - 1)
@@ -0,0 +1,191 @@
+import numpy as np
+
+# What advance() can sample: the mean velocity (mean of the lane means, as
+# highway_velocity), the flow per step, the number of cars and the fraction
+# of cars standing still
+OBSERVABLES = {"velocity": float, "flow": float, "cars": int, "jammed": float}
+
+
+class RunningStats:
+    # Welford's running mean and variance. Values may be scalars or arrays of
+    # a fixed shape (e.g. one per ensemble replica).
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def push(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean = self.mean + delta / self.count
+        self.m2 = self.m2 + delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        return self.m2 / max(self.count - 1, 1)
+
+
+class BatchMeans:
+    # Means of consecutive batches of samples. Whenever 2 * max_batches
+    # batches are full, neighbours are merged and the batch size doubles, so
+    # memory stays bounded and batches grow past the autocorrelation time.
+    def __init__(self, max_batches=32):
+        self.max_batches = max_batches
+        self.size = 1
+        self.filled = 0
+        self.total = 0.0
+        self.batches = []
+
+    def push(self, value):
+        self.total = self.total + value
+        self.filled += 1
+        if self.filled < self.size:
+            return
+
+        self.batches.append(self.total / self.size)
+        self.total = 0.0
+        self.filled = 0
+        if len(self.batches) == 2 * self.max_batches:
+            self.batches = [(a + b) / 2
+                            for a, b in zip(self.batches[::2],
+                                            self.batches[1::2])]
+            self.size *= 2
+
+    @property
+    def stderr(self):
+        if len(self.batches) < 2:
+            return np.inf
+        means = np.array(self.batches)
+        return means.std(axis=0, ddof=1) / np.sqrt(len(means))
+
+
+class Observable:
+    # Running statistics of one measured quantity, ignoring the first
+    # `warmup` samples. The standard error comes from the batch means, so it
+    # accounts for the correlation between consecutive steps.
+    def __init__(self, warmup=0, max_batches=32):
+        self.warmup = warmup
+        self.seen = 0
+        self.stats = RunningStats()
+        self.batches = BatchMeans(max_batches)
+
+    def push(self, value):
+        self.seen += 1
+        if self.seen <= self.warmup:
+            return
+        self.stats.push(value)
+        self.batches.push(value)
+
+    @property
+    def count(self):
+        return self.stats.count
+
+    @property
+    def mean(self):
+        return self.stats.mean
+
+    @property
+    def variance(self):
+        return self.stats.variance
+
+    @property
+    def stderr(self):
+        return self.batches.stderr
+
+    def half_width(self, z=1.96):
+        return z * self.stderr
+
+    def converged(self, tol, atol=1e-3, z=1.96, min_batches=16,
+                  min_batch_size=8):
+        # True once the confidence interval is within tol of the mean, or
+        # within atol for means close to zero. Short batches underestimate
+        # the error of correlated samples, so nothing converges before the
+        # batches reach min_batch_size. Undefined (nan) means, such as the
+        # velocity of an empty road, never change and count as converged.
+        if (len(self.batches.batches) < min_batches
+                or self.batches.size < min_batch_size):
+            return False
+        bound = np.maximum(tol * np.abs(self.mean), atol)
+        return bool(
+            np.all((self.half_width(z) <= bound) | np.isnan(self.mean)))
+
+
+def road_observables(highway, names):
+    # The requested observables of a (lanes, lane_len) road or a stack of
+    # them, sharing one per-lane car count
+    counts = (0 <= highway).sum(axis=-1)
+    values = {}
+    if "velocity" in names:
+        # Empty and blocked cells clip to a velocity of zero
+        sums = np.maximum(highway, 0).sum(axis=-1)
+        values["velocity"] = (sums / counts).mean(axis=-1)
+    if "cars" in names:
+        values["cars"] = counts.sum(axis=-1)
+    if "jammed" in names:
+        values["jammed"] = np.count_nonzero(highway == 0, axis=(-2, -1)) / \
+            counts.sum(axis=-1)
+    return values
+
+
+def advance(model, n_steps, observe=("velocity", ), every=1, out=None):
+    # Steps the model (or an Ensemble) n_steps times and samples the
+    # observables every `every` steps into arrays with one row per sample,
+    # written into `out` when given. The flow is averaged over the steps
+    # since the previous sample, from the model's flow counter.
+    unknown = set(observe) - set(OBSERVABLES)
+    if unknown:
+        raise ValueError(f"Unknown observables {sorted(unknown)}")
+    n_samples = n_steps // every
+    shape = (n_samples, ) + np.shape(model.flow_count)
+    out = {} if out is None else out
+    for name in observe:
+        if name not in out:
+            out[name] = np.empty(shape, dtype=OBSERVABLES[name])
+    road = [name for name in observe if name != "flow"]
+
+    # Ensembles step without computing the velocities simulate() returns,
+    # unless simulate is wrapped (e.g. by a recorder or checkpointer)
+    simulate = model.simulate
+    if hasattr(model, "step") and "simulate" not in vars(model):
+        simulate = model.step
+    flow_count = np.copy(model.flow_count)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for sample in range(n_samples):
+            for _ in range(every):
+                simulate()
+            if "flow" in observe:
+                out["flow"][sample] = (model.flow_count - flow_count) / every
+                flow_count = np.copy(model.flow_count)
+            if road:
+                for name, value in road_observables(model.highway,
+                                                    road).items():
+                    out[name][sample] = value
+    for _ in range(n_steps - n_samples * every):
+        simulate()
+    return {name: out[name] for name in observe}
+
+
+def measure(model,
+            observe=("velocity", "flow"),
+            warmup=0,
+            max_steps=1000,
+            tol=None,
+            atol=1e-3,
+            check_every=100):
+    # Steps the model (or an Ensemble) and records the mean velocity and the
+    # flow per step. With tol set, stops as soon as every observable has
+    # converged, checking every check_every steps, otherwise runs warmup +
+    # max_steps steps.
+    observables = {name: Observable() for name in observe}
+    model.advance(warmup, observe=())
+    for start in range(0, max_steps, check_every):
+        series = model.advance(min(check_every, max_steps - start), observe)
+        for name in observe:
+            for value in series[name]:
+                observables[name].push(value)
+
+        if (tol is not None and start + check_every <= max_steps
+                and all(observable.converged(tol, atol)
+                        for observable in observables.values())):
+            break
+    return observables
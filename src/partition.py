@@ -0,0 +1,277 @@
+import multiprocessing as mp
+from multiprocessing import connection, shared_memory
+
+import numpy as np
+
+from src import vectorized
+
+# One long road stepped by several processes. The ring is cut into
+# contiguous segments of cells (all lanes), each owned by one worker. The
+# grid lives in shared memory, so the halo of max_velocity cells a worker
+# needs on either side of its segment is read straight from its
+# neighbours' cells between barriers, and the worker writes only its own.
+#
+# The numpy kernels draw one uniform per car (three for lane changes) in
+# row-major car order. Every worker jumps its copy of the model's bit
+# generator to the draws of its own cars, so a partitioned run leaves the
+# road, flow count and generator exactly as the numpy backend would.
+
+
+def segment_bounds(lane_len, n_segments):
+    return np.linspace(0, lane_len, n_segments + 1).astype(int)
+
+
+class Draws:
+    # Stands in for the rng of a vectorized kernel, handing it the uniforms
+    # prepared for the cars of a window
+    def __init__(self, values):
+        self.values = values
+
+    def random(self, shape):
+        return self.values.reshape(shape)
+
+
+class Segment:
+    def __init__(self, index, bounds, shape, dtype, names, prob,
+                 max_velocity, lane_changes, block_distance, can_merge,
+                 rng_state):
+        n_lanes, lane_len = shape
+        self.index = index
+        self.start, self.end = bounds[index], bounds[index + 1]
+        self.size = self.end - self.start
+        self.prob = prob
+        self.max_velocity = max_velocity
+        self.lane_changes = lane_changes and 1 < n_lanes
+
+        # A single segment is the whole ring and needs no halo
+        self.halo = max_velocity if 1 < len(bounds) - 1 else 0
+        cells = np.arange(self.start - self.halo, self.end + self.halo)
+        self.window = cells % lane_len
+        self.behind = self.window[:self.halo + self.size]
+
+        self.memory = [shared_memory.SharedMemory(name) for name in names]
+        current, scratch, counts, flows = self.memory
+        self.current = np.ndarray(shape, dtype=dtype, buffer=current.buf)
+        self.scratch = np.ndarray(shape, dtype=dtype, buffer=scratch.buf)
+        # Per-lane car counts of every segment after the merge and after the
+        # lane changes, so neither is overwritten while being read
+        self.all_counts = np.ndarray((2, len(bounds) - 1, n_lanes),
+                                     dtype=np.int64,
+                                     buffer=counts.buf)
+        self.counts = self.all_counts[0]
+        self.flows = np.ndarray(len(bounds) - 1,
+                                dtype=np.int64,
+                                buffer=flows.buf)
+
+        self.block_distance = block_distance
+        self.can_merge = None if can_merge is None else \
+            can_merge[:, :, self.start:self.end]
+
+        bit_generator = getattr(np.random, rng_state["bit_generator"])()
+        bit_generator.state = rng_state
+        self.rng_state = rng_state
+        self.bit_generator = bit_generator
+        self.generator = np.random.Generator(bit_generator)
+        self.drawn = 0
+
+    def own(self, grid):
+        return grid[:, self.start:self.end]
+
+    def count_cars(self, grid, phase):
+        self.all_counts[phase, self.index] = np.count_nonzero(
+            0 <= self.own(grid), axis=1)
+        self.counts = self.all_counts[phase]
+
+    def uniforms(self, position, count):
+        self.bit_generator.state = self.rng_state
+        self.bit_generator.advance(int(position))
+        return self.generator.random(count)
+
+    def draws(self, window, rows):
+        # Uniforms for every car of the window in row-major order: the
+        # stream's own for the segment's cars, zeros for the halo cars whose
+        # results are thrown away
+        n_cars = self.counts.sum()
+        offsets = (np.cumsum(self.counts.sum(axis=0)) -
+                   self.counts.sum(axis=0) +
+                   self.counts[:self.index].sum(axis=0))
+        cars = 0 <= window
+        left = np.count_nonzero(cars[:, :self.halo], axis=1)
+        right = np.count_nonzero(cars[:, self.halo + self.size:], axis=1)
+
+        values = []
+        for row in range(rows):
+            for lane, offset in enumerate(offsets):
+                values.append(np.zeros(left[lane]))
+                values.append(
+                    self.uniforms(self.drawn + row * n_cars + offset,
+                                  self.counts[self.index, lane]))
+                values.append(np.zeros(right[lane]))
+        self.drawn += rows * n_cars
+        return Draws(np.concatenate(values))
+
+    def update_lanes(self):
+        window = self.current[:, self.window]
+        if self.lane_changes:
+            vectorized.update_lanes(window, self.prob, self.max_velocity,
+                                    self.draws(window, 3))
+        self.own(self.scratch)[:] = window[:, self.halo:self.halo +
+                                           self.size]
+        self.count_cars(self.scratch, 1)
+
+    def update_velocity(self):
+        window = self.scratch[:, self.window]
+        vectorized.update_velocity(window, self.prob, self.max_velocity,
+                                   self.draws(window, 1))
+        self.own(self.scratch)[:] = window[:, self.halo:self.halo +
+                                           self.size]
+
+    def update_position(self):
+        # Pulls every car that lands in the segment, from the segment itself
+        # or from the halo behind it
+        lane_len = self.current.shape[-1]
+        before = self.scratch[:, self.behind]
+        lanes, cells = np.nonzero(0 <= before)
+        velocity = before[lanes, cells]
+        source = self.behind[cells]
+
+        moves = velocity
+        self.hold = None
+        if self.block_distance is not None:
+            held = np.maximum(velocity, 1) >= self.block_distance[lanes,
+                                                                  source]
+            moves = np.where(held, 0, velocity)
+            self.hold = np.zeros((len(before), self.size), dtype=bool)
+            mine = self.halo <= cells
+            self.hold[lanes[mine & held],
+                      cells[mine & held] - self.halo] = True
+
+        targets = source + moves
+        landing = (targets % lane_len - self.start) % lane_len < self.size
+        own = self.own(self.current)
+        own[:] = -1
+        np.copyto(own, -2, where=self.own(self.scratch) == -2)
+        own[lanes[landing],
+            targets[landing] % lane_len - self.start] = velocity[landing]
+        self.flows[self.index] += np.count_nonzero(
+            lane_len <= targets[landing])
+
+    def merge_cars(self):
+        if self.hold is not None:
+            own = self.own(self.current).copy()
+            vectorized.merge(own, self.hold, self.can_merge)
+            self.own(self.current)[:] = own
+        self.count_cars(self.current, 0)
+
+    def close(self):
+        for memory in self.memory:
+            memory.close()
+
+
+# Seconds a worker waits for the others at a barrier before giving up
+BARRIER_TIMEOUT = 60
+
+
+def run_segment(barrier, n_steps, *args):
+    segment = None
+    try:
+        segment = Segment(*args)
+        for _ in range(n_steps):
+            segment.update_lanes()
+            barrier.wait(BARRIER_TIMEOUT)
+            segment.update_velocity()
+            barrier.wait(BARRIER_TIMEOUT)
+            segment.update_position()
+            barrier.wait(BARRIER_TIMEOUT)
+            segment.merge_cars()
+            barrier.wait(BARRIER_TIMEOUT)
+    except BaseException:
+        # Breaks the barrier so the other workers stop instead of waiting
+        # for this one forever
+        barrier.abort()
+        raise
+    finally:
+        if segment is not None:
+            segment.close()
+
+
+def join_segments(processes):
+    # Waits for every worker, terminating the others as soon as one fails
+    try:
+        pending = list(processes)
+        while pending:
+            connection.wait([process.sentinel for process in pending])
+            for process in [p for p in pending if not p.is_alive()]:
+                process.join()
+                pending.remove(process)
+                if process.exitcode:
+                    raise RuntimeError(
+                        f"Segment worker {processes.index(process)} failed "
+                        f"with exit code {process.exitcode}")
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+
+def simulate_partitioned(model, n_steps, workers=2):
+    # Steps an NSModel or Zipper n_steps times with its road split over
+    # `workers` processes, leaving it as n_steps calls of simulate() with the
+    # numpy backend would
+    n_lanes, lane_len = model.highway.shape
+    bounds = segment_bounds(lane_len, workers)
+    sizes = np.diff(bounds)
+    if 1 < workers and (sizes.min() <= model.max_velocity
+                        or lane_len < sizes.max() + 2 * model.max_velocity):
+        raise ValueError(f"A lane of {lane_len} cells is too short for "
+                         f"{workers} segments at max_velocity "
+                         f"{model.max_velocity}")
+    bit_generator = model.rng.bit_generator
+    if not hasattr(bit_generator, "advance"):
+        raise ValueError(f"{type(bit_generator).__name__} cannot jump ahead")
+
+    grid = np.ascontiguousarray(model.highway)
+    counts = np.zeros((2, workers, n_lanes), dtype=np.int64)
+    for index in range(workers):
+        counts[0, index] = np.count_nonzero(
+            0 <= grid[:, bounds[index]:bounds[index + 1]], axis=1)
+    arrays = [grid, grid, counts, np.zeros(workers, dtype=np.int64)]
+    memory = [
+        shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        for array in arrays
+    ]
+    try:
+        for block, array in zip(memory, arrays):
+            np.ndarray(array.shape, dtype=array.dtype,
+                       buffer=block.buf)[:] = array
+
+        barrier = mp.Barrier(workers)
+        zipper = hasattr(model, "block_distance")
+        args = (bounds, grid.shape, grid.dtype.str,
+                [block.name for block in memory],
+                model.prob, model.max_velocity, model.lane_changes,
+                model.block_distance if zipper else None,
+                model.can_merge if zipper else None, bit_generator.state)
+        processes = [
+            mp.Process(target=run_segment,
+                       args=(barrier, n_steps, index) + args)
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        join_segments(processes)
+
+        model.highway = np.ndarray(grid.shape,
+                                   dtype=grid.dtype,
+                                   buffer=memory[0].buf).copy()
+        model.flow_count += int(
+            np.ndarray(workers, dtype=np.int64, buffer=memory[3].buf).sum())
+    finally:
+        for block in memory:
+            block.close()
+            block.unlink()
+
+    n_cars = int(counts[0].sum())
+    draws = 4 if model.lane_changes and 1 < n_lanes else 1
+    bit_generator.advance(n_steps * draws * n_cars)
@@ -0,0 +1,44 @@
+import glob
+import sys
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+# The plotting stage: renders the results files written by the sweeps in
+# src.validation, so figures can be redrawn without simulating anything.
+
+
+def plt_helper(title, xlabel, ylabel, save=False):
+    plt.title(title)
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    if plt.gca().get_legend_handles_labels()[0]:
+        plt.legend(loc="upper right")
+
+    if save:
+        plt.savefig(f"./figures/{title}.png", format="png")
+    else:
+        plt.show()
+
+    plt.cla()
+
+
+def plot_results(path, save=True):
+    with np.load(path) as results:
+        if "image" in results:
+            plt.imshow(results["image"], cmap="Blues", interpolation="nearest")
+        if "curves" in results:
+            # Adaptive sweeps also save error bars, on a non-uniform x
+            errors = results["errors"] if "errors" in results else \
+                [None] * len(results["curves"])
+            for label, values, error in zip(results["labels"],
+                                            results["curves"], errors):
+                plt.errorbar(results["x"], values, yerr=error,
+                             label=str(label))
+        plt_helper(str(results["title"]), str(results["xlabel"]),
+                   str(results["ylabel"]), save)
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:] or sorted(glob.glob("./results/*.npz")):
+        plot_results(path)
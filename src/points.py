@@ -0,0 +1,213 @@
+import os
+import warnings
+
+import numpy as np
+
+from src.backends import get_backend
+from src.cache import digest
+from src.checkpoint import load_checkpoint, save_checkpoint
+from src.ensemble import Ensemble
+from src.model import NSModel
+from src.observables import measure
+from src.sparse import SparseNSModel, SparseZipper
+from src.zipper import Zipper
+
+# The per-task functions the sweeps and batch studies run on the process
+# pool, and the seeds each task runs with. Their cached results are keyed on
+# this module and the simulation modules only, see src.cache.code_version.
+
+# Models a batch study may name
+MODELS = {
+    cls.__name__: cls
+    for cls in (NSModel, Zipper, SparseNSModel, SparseZipper)
+}
+
+
+def init_model(model,
+               prob=0.5,
+               n_lanes=3,
+               lane_len=200,
+               max_velocity=5,
+               lane_density=0.5,
+               lane_changes=False,
+               initialize_highway=True,
+               n_blocked=1,
+               portion_blocked=0.2,
+               backend=None,
+               seed=None):
+    # Sweeps default to the numpy kernels unless TRAFFIC_BACKEND says otherwise
+    backend = get_backend(backend, default="numpy")
+    if not issubclass(model, Zipper):
+        return model(prob=prob,
+                     n_lanes=n_lanes,
+                     lane_len=lane_len,
+                     max_velocity=max_velocity,
+                     lane_density=lane_density,
+                     lane_changes=lane_changes,
+                     initialize_highway=initialize_highway,
+                     backend=backend,
+                     seed=seed)
+    return model(prob=prob,
+                 n_lanes=n_lanes,
+                 lane_len=lane_len,
+                 max_velocity=max_velocity,
+                 lane_density=lane_density,
+                 lane_changes=lane_changes,
+                 n_blocked=n_blocked,
+                 portion_blocked=portion_blocked,
+                 backend=backend,
+                 seed=seed)
+
+
+def model_velocity(seed=None, steps=100, warmup=0, tol=None, **params):
+    model = init_model(seed=seed, **params)
+    return measure(model, ["velocity"],
+                   warmup=warmup,
+                   max_steps=steps * 10,
+                   tol=tol)["velocity"].mean
+
+
+def model_flow(seed=None, lane_len=200, **params):
+    model = init_model(lane_len=lane_len, seed=seed, **params)
+    model.advance(lane_len, observe=())
+    return model.flow_count / lane_len
+
+
+def model_series(out, seed=None, steps=100, warmup=0, **params):
+    # Per-step mean velocity, flow and optionally the whole road of one run,
+    # written into `out`, the task's row of a SharedResults
+    model = init_model(seed=seed, **params)
+    model.advance(warmup, observe=())
+    if "frames" not in out:
+        model.advance(steps, ["velocity", "flow"], out=out)
+        return
+    with np.errstate(invalid="ignore"):
+        for step in range(steps):
+            flow_count = model.flow_count
+            model.simulate()
+            out["velocity"][step] = model.highway_velocity()
+            out["flow"][step] = model.flow_count - flow_count
+            out["frames"][step] = model.highway
+
+
+def ensemble_velocity(seed=None,
+                      steps=100,
+                      repeats=1,
+                      warmup=0,
+                      tol=None,
+                      lane_density=0.5,
+                      **params):
+    # Mean velocity at one density, or at each of a list of densities, with
+    # `repeats` replicas per density stacked into one ensemble
+    densities = np.atleast_1d(lane_density)
+    ensemble = Ensemble(replicas=len(densities) * repeats,
+                        lane_density=np.repeat(densities, repeats),
+                        seed=seed,
+                        **params)
+    velocity = measure(ensemble, ["velocity"],
+                       warmup=warmup,
+                       max_steps=steps * 10,
+                       tol=tol)["velocity"].mean
+    values = np.reshape(velocity, (len(densities), repeats)).mean(axis=1)
+    return values if np.ndim(lane_density) else values[0]
+
+
+def ensemble_flow(seed=None,
+                  repeats=1,
+                  lane_len=200,
+                  lane_density=0.5,
+                  **params):
+    # Flow per step at one density, or at each of a list of densities, with
+    # `repeats` replicas per density stacked into one ensemble
+    densities = np.atleast_1d(lane_density)
+    ensemble = Ensemble(replicas=len(densities) * repeats,
+                        lane_len=lane_len,
+                        lane_density=np.repeat(densities, repeats),
+                        seed=seed,
+                        **params)
+    ensemble.advance(lane_len, observe=())
+    values = np.reshape(ensemble.flow_count / lane_len,
+                        (len(densities), repeats)).mean(axis=1)
+    return values if np.ndim(lane_density) else values[0]
+
+
+def warm_walk(seed=None,
+              densities=(),
+              observe="velocity",
+              max_steps=1000,
+              warmup=200,
+              settle=50,
+              tol=None,
+              ensemble=False,
+              replicas=1,
+              checkpoint=None,
+              **params):
+    # Walks the density axis on one road (or one ensemble of roads), adding
+    # or removing cars between points and re-equilibrating for `settle`
+    # steps instead of paying the full warm-up from a random start. With a
+    # checkpoint file the road and the values so far are saved after every
+    # point, and a rerun continues from the last one.
+    values = []
+    if checkpoint is not None and os.path.exists(checkpoint):
+        model, extra = load_checkpoint(checkpoint)
+        values = list(extra["values"])
+    elif ensemble:
+        model = Ensemble(replicas=replicas,
+                         lane_density=densities[0],
+                         seed=seed,
+                         **params)
+    else:
+        model = init_model(lane_density=densities[0], seed=seed, **params)
+
+    for i in range(len(values), len(densities)):
+        model.set_density(densities[i])
+        observables = measure(model, [observe],
+                              warmup=warmup if i == 0 else settle,
+                              max_steps=max_steps,
+                              tol=tol)
+        values.append(np.average(observables[observe].mean))
+        if checkpoint is not None:
+            save_checkpoint(model, checkpoint, values=values)
+    return values
+
+
+def run_scenario(seed=None,
+                 model="NSModel",
+                 steps=100,
+                 warmup=100,
+                 every=1,
+                 observe=("velocity", "flow"),
+                 **params):
+    # Mean of every observable over `steps` steps after `warmup`, for one
+    # run of the named model. Samples without a value, such as the velocity
+    # while a lane is empty, are left out; nan if all of them are.
+    road = init_model(MODELS[model], seed=seed, **params)
+    road.advance(warmup, observe=())
+    series = road.advance(steps, observe, every)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.array([np.nanmean(series[name]) for name in observe])
+
+
+def occurrences(tasks):
+    # How many identical tasks (e.g. replicas) come before each task
+    seen = {}
+    counts = []
+    for task in tasks:
+        key = digest(task)
+        counts.append(seen.get(key, 0))
+        seen[key] = counts[-1] + 1
+    return counts
+
+
+def task_seeds(seed, tasks):
+    # Independent per-task seed sequences derived from one master seed and
+    # each task's own parameters (and its place among identical tasks), so a
+    # sweep is reproducible whatever the number of workers or the chunking,
+    # and a point keeps its seed when the grid around it changes.
+    return [
+        np.random.SeedSequence(
+            [seed, occurrence] +
+            [int(digest(task)[i:i + 8], 16) for i in range(0, 64, 8)])
+        for task, occurrence in zip(tasks, occurrences(tasks))
+    ]
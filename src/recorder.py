@@ -0,0 +1,155 @@
+import struct
+
+import numpy as np
+
+# Fixed-size .npy header, so the frame count can be rewritten in place once
+# the run is over
+HEADER_LEN = 128
+
+
+def write_header(file, shape):
+    header = "{'descr': '|i1', 'fortran_order': False, 'shape': %r, }" % (
+        tuple(shape), )
+    header = header.ljust(HEADER_LEN - 11) + "\n"
+    file.seek(0)
+    file.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) +
+               header.encode("latin1"))
+
+
+def wrap_simulate(model, after):
+    # Makes model.simulate call after(model) at the end of every step, on
+    # top of any wrapper already there, and returns a function undoing it.
+    # The previous simulate is put back while this wrapper is the outermost
+    # one, skipping wrappers underneath that were undone already; otherwise
+    # it only stops calling `after`, so the wrappers added since keep
+    # working.
+    previous = model.__dict__.get("simulate")
+    simulate = model.simulate
+
+    def wrapped():
+        simulate()
+        if not wrapped.detached:
+            after(model)
+
+    def unwrap():
+        wrapped.detached = True
+        if model.__dict__.get("simulate") is wrapped:
+            restore = previous
+            while getattr(restore, "detached", False):
+                restore = restore.previous
+            if restore is None:
+                del model.simulate
+            else:
+                model.simulate = restore
+
+    wrapped.detached = False
+    wrapped.previous = previous
+    model.simulate = wrapped
+    return unwrap
+
+
+def read_trajectory(path):
+    # Frames as a read-only memory map: slicing it returns views, nothing is
+    # read from disk until used.
+    return np.load(path, mmap_mode="r")
+
+
+class TrajectoryRecorder:
+    # Streams model.highway as int8 frames to an .npy file, chunk_size
+    # frames at a time. Only every `every`-th step is kept; with ring=N only
+    # the last N kept frames survive.
+    def __init__(self, path, every=1, chunk_size=64, ring=None):
+        self.path = path
+        self.every = every
+        self.chunk_size = chunk_size
+        self.ring = ring
+        self.step = 0
+        self.n_frames = 0
+        self.pending = 0
+        self.buffer = None
+        self.file = open(path, "w+b")
+        self.model = None
+        self.unwrap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __call__(self, model):
+        self.record(model)
+
+    def attach(self, model):
+        # Records the current state, then every step the model simulates
+        self.model = model
+        self.unwrap = wrap_simulate(model, self.record)
+        self.record(model)
+        return self
+
+    def detach(self):
+        if self.model is not None:
+            self.unwrap()
+            self.model = None
+
+    def record(self, model):
+        if self.step % self.every == 0:
+            self.push(model.highway)
+        self.step += 1
+
+    def push(self, grid):
+        if self.buffer is None:
+            self.buffer = np.empty((self.chunk_size, ) + grid.shape,
+                                   dtype=np.int8)
+            write_header(self.file, (0, ) + grid.shape)
+
+        self.buffer[self.pending] = grid
+        self.pending += 1
+        if self.pending == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        frames = self.buffer[:self.pending]
+        frame_bytes = frames[0].nbytes
+        if self.ring is None:
+            self.file.seek(HEADER_LEN + self.n_frames * frame_bytes)
+            self.file.write(frames.tobytes())
+        else:
+            for i, frame in enumerate(frames):
+                slot = (self.n_frames + i) % self.ring
+                self.file.seek(HEADER_LEN + slot * frame_bytes)
+                self.file.write(frame.tobytes())
+
+        self.n_frames += self.pending
+        self.pending = 0
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.detach()
+        self.flush()
+
+        if self.buffer is None:
+            write_header(self.file, (0, ))
+            self.file.close()
+            return
+
+        shape = self.buffer.shape[1:]
+        n_kept = self.n_frames
+        if self.ring is not None and self.ring < self.n_frames:
+            # Rotate the ring so the oldest frame comes first
+            n_kept = self.ring
+            frame_bytes = self.buffer[0].nbytes
+            self.file.seek(HEADER_LEN)
+            frames = np.frombuffer(self.file.read(n_kept * frame_bytes),
+                                   dtype=np.int8).reshape((n_kept, ) + shape)
+            self.file.seek(HEADER_LEN)
+            self.file.write(
+                np.roll(frames, -(self.n_frames % self.ring), axis=0).tobytes())
+
+        self.file.truncate(HEADER_LEN + n_kept * self.buffer[0].nbytes)
+        write_header(self.file, (n_kept, ) + shape)
+        self.file.close()
@@ -0,0 +1,93 @@
+import os
+import shutil
+import struct
+import subprocess
+import zlib
+
+import numpy as np
+
+WHITE = (255, 255, 255)
+RED = (255, 0, 0)
+BLACK = (0, 0, 0)
+
+
+def colour_table(empty=WHITE, car=RED, blocked=BLACK):
+    # RGB for every int8 cell value, indexed by value + 2: -2 is blocked,
+    # -1 is empty and any velocity is a car.
+    table = np.empty((130, 3), dtype=np.uint8)
+    table[0] = blocked
+    table[1] = empty
+    table[2:] = car
+    return table
+
+
+def to_rgb(frame, table, cell=8):
+    rgb = table[frame.astype(np.intp) + 2]
+    rgb = rgb.repeat(cell, axis=0).repeat(cell, axis=1)
+    # yuv420p encoding needs even dimensions
+    pad = ((0, rgb.shape[0] % 2), (0, rgb.shape[1] % 2), (0, 0))
+    return np.pad(rgb, pad, constant_values=255)
+
+
+def find_encoder():
+    if os.name == 'nt' and os.path.exists('C:\\ffmpeg\\bin\\ffmpeg.exe'):
+        return 'C:\\ffmpeg\\bin\\ffmpeg.exe'
+    return shutil.which('ffmpeg')
+
+
+def write_png(path, rgb):
+    def chunk(tag, data):
+        return (struct.pack(">I", len(data)) + tag + data +
+                struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff))
+
+    height, width = rgb.shape[:2]
+    rows = np.hstack((np.zeros((height, 1), dtype=np.uint8),
+                      rgb.reshape(height, width * 3)))
+    with open(path, "wb") as file:
+        file.write(b"\x89PNG\r\n\x1a\n" + chunk(
+            b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) +
+                   chunk(b"IDAT", zlib.compress(rows.tobytes(), 1)) +
+                   chunk(b"IEND", b""))
+
+
+def render(frames,
+           path,
+           table=None,
+           cell=8,
+           fps=24,
+           hold=6,
+           encoder=None,
+           fallback="png"):
+    # Encodes a (steps, lanes, len) stack of frames to a video. Each frame is
+    # shown for `hold` video frames by lowering the input frame rate rather
+    # than by writing it several times. Without an encoder the frames are
+    # written once each as numbered PNGs, or as raw .rgb with fallback="rgb",
+    # into a directory next to `path`. Returns what was written.
+    table = colour_table() if table is None else table
+    encoder = encoder or find_encoder()
+    height, width = to_rgb(frames[0], table, cell).shape[:2]
+
+    if encoder is None:
+        directory = os.path.splitext(path)[0] + "_frames"
+        os.makedirs(directory, exist_ok=True)
+        for i, frame in enumerate(frames):
+            name = os.path.join(directory, f"frame_{i:05d}.{fallback}")
+            if fallback == "png":
+                write_png(name, to_rgb(frame, table, cell))
+            else:
+                to_rgb(frame, table, cell).tofile(name)
+        return directory
+
+    process = subprocess.Popen([
+        encoder, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt",
+        "rgb24", "-s", f"{width}x{height}", "-framerate", f"{fps}/{hold}",
+        "-i", "-", "-r",
+        str(fps), "-pix_fmt", "yuv420p", path
+    ],
+                               stdin=subprocess.PIPE)
+    for frame in frames:
+        process.stdin.write(to_rgb(frame, table, cell).tobytes())
+    process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError(f"{encoder} exited with {process.returncode}")
+    return path
@@ -0,0 +1,122 @@
+import inspect
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor as PoolExecutor
+from concurrent.futures import as_completed
+from multiprocessing import cpu_count
+
+from src.points import occurrences, task_seeds
+from src.shared import AttachedResults
+
+
+def run_chunk(fn, chunk, shared=None, checkpoints=None):
+    # With `shared` (a SharedResults spec), fn also gets out=, its task's row
+    # of every shared array, to write results into in place. With
+    # `checkpoints` (paths by task index), fn gets checkpoint=, a file to
+    # snapshot its progress to and resume from.
+    extra = {}
+    results = None if shared is None else AttachedResults(shared)
+    try:
+        done = []
+        for index, seed, task in chunk:
+            if results is not None:
+                extra["out"] = results.row(index)
+            if checkpoints is not None:
+                extra["checkpoint"] = checkpoints[index]
+            done.append((index, fn(seed=seed, **extra, **task)))
+            extra.clear()
+        return done
+    finally:
+        if results is not None:
+            results.close()
+
+
+class Progress:
+    def __init__(self, total, label="sweep", stream=sys.stderr, every=1.0):
+        self.total = total
+        self.label = label
+        self.stream = stream
+        self.every = every
+        self.done = 0
+        self.start = time.time()
+        self.last = 0
+
+    def update(self, n_done):
+        self.done += n_done
+        now = time.time()
+        if now - self.last < self.every and self.done < self.total:
+            return
+        self.last = now
+        rate = self.done / max(now - self.start, 1e-9)
+        self.stream.write(f"\r[{self.label}] {self.done}/{self.total} tasks "
+                          f"({rate:.1f} tasks/s)")
+        if self.done == self.total:
+            self.stream.write(f" in {now - self.start:.1f}s\n")
+        self.stream.flush()
+
+
+def run_tasks(fn,
+              tasks,
+              workers=None,
+              chunksize=None,
+              seed=0,
+              progress=True,
+              label="sweep",
+              shared=None,
+              cache=None):
+    # Runs fn(seed=..., **task) for every task dict on a process pool and
+    # returns the results in task order, whatever order they complete in.
+    # Bulky results can go through `shared`, a SharedResults with one row
+    # per task, instead of the return value. With a ResultCache, only the
+    # tasks missing from it are run, and their results are added to it;
+    # functions taking a `checkpoint` argument also get a snapshot file in
+    # the cache, so a killed sweep resumes inside its unfinished tasks.
+    workers = workers or cpu_count()
+    seeds = task_seeds(seed, tasks)
+    results = [None] * len(tasks)
+
+    keys = {}
+    if cache is not None and shared is None:
+        for index, (task, occurrence) in enumerate(
+                zip(tasks, occurrences(tasks))):
+            key = cache.key(fn, task, seed, occurrence)
+            results[index] = cache.get(key)
+            if results[index] is None:
+                keys[index] = key
+
+    jobs = [(index, seeds[index], task) for index, task in enumerate(tasks)
+            if cache is None or shared is not None or index in keys]
+    chunksize = chunksize or max(1, len(jobs) // (workers * 4))
+    chunks = [jobs[i:i + chunksize] for i in range(0, len(jobs), chunksize)]
+
+    spec = None if shared is None else shared.spec
+    checkpoints = None
+    if keys and "checkpoint" in inspect.signature(fn).parameters:
+        checkpoints = {index: cache.checkpoint(key)
+                       for index, key in keys.items()}
+    tracker = Progress(len(jobs), label) if progress and jobs else None
+
+    def collect(chunk):
+        for index, result in chunk:
+            results[index] = result
+            if index in keys:
+                cache.put(keys[index], result)
+            if checkpoints is not None and os.path.exists(checkpoints[index]):
+                os.remove(checkpoints[index])
+        if tracker:
+            tracker.update(len(chunk))
+
+    if workers == 1:
+        for chunk in chunks:
+            collect(run_chunk(fn, chunk, spec, checkpoints))
+        return results
+
+    with PoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(run_chunk, fn, chunk, spec, checkpoints)
+            for chunk in chunks
+        ]
+        for future in as_completed(futures):
+            collect(future.result())
+    return results
@@ -0,0 +1,69 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedResults:
+    # Named result arrays in shared memory with one row per task. Pooled
+    # workers attach to them by name and write their task's row in place,
+    # so results come back to the parent as plain numpy views instead of
+    # being pickled. Use as a context manager, or close() when done; the
+    # parent's views are invalid afterwards.
+    def __init__(self, n_tasks, fields):
+        # fields maps each name to the (shape, dtype) of one task's result
+        self.n_tasks = n_tasks
+        self.memory = {}
+        self.arrays = {}
+        for name, (shape, dtype) in fields.items():
+            shape = (n_tasks, ) + tuple(np.atleast_1d(shape))
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            self.memory[name] = block
+            self.arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            self.arrays[name].fill(0)
+
+    @property
+    def spec(self):
+        # Everything a worker needs to attach, small enough to pickle
+        return {
+            name: (self.memory[name].name, array.shape, array.dtype.str)
+            for name, array in self.arrays.items()
+        }
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def row(self, index):
+        return {name: array[index] for name, array in self.arrays.items()}
+
+    def close(self):
+        self.arrays = {}
+        for block in self.memory.values():
+            block.close()
+            block.unlink()
+        self.memory = {}
+
+
+class AttachedResults:
+    # A worker's side of SharedResults
+    def __init__(self, spec):
+        self.memory = []
+        self.arrays = {}
+        for name, (block_name, shape, dtype) in spec.items():
+            block = shared_memory.SharedMemory(block_name)
+            self.memory.append(block)
+            self.arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    def row(self, index):
+        return {name: array[index] for name, array in self.arrays.items()}
+
+    def close(self):
+        self.arrays = {}
+        for block in self.memory:
+            block.close()
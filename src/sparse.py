@@ -0,0 +1,291 @@
+import numpy as np
+
+from src.backends import get_backend
+from src.model import NSModel
+from src.zipper import Zipper
+
+
+class SparseHighway:
+    # Per-lane sorted arrays of car positions and velocities plus [start, end)
+    # blockage intervals, so memory and step cost scale with the number of
+    # cars rather than the number of cells.
+    def __init__(self, n_lanes, lane_len, rng=None):
+        self.n_lanes = n_lanes
+        self.lane_len = lane_len
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.positions = [np.empty(0, dtype=int) for _ in range(n_lanes)]
+        self.velocities = [np.empty(0, dtype=int) for _ in range(n_lanes)]
+        self.blockages = [np.empty((0, 2), dtype=int) for _ in range(n_lanes)]
+
+    @classmethod
+    def from_grid(cls, grid, rng=None):
+        state = cls(*grid.shape, rng)
+        for i, lane in enumerate(grid):
+            cells = np.nonzero(0 <= lane)[0]
+            state.positions[i] = cells
+            state.velocities[i] = lane[cells].astype(int)
+
+            blocked = np.diff(
+                np.concatenate(([0], lane == -2, [0])).astype(int))
+            state.blockages[i] = np.column_stack(
+                (np.nonzero(blocked == 1)[0], np.nonzero(blocked == -1)[0]))
+        return state
+
+    def to_grid(self):
+        grid = -1 * np.ones((self.n_lanes, self.lane_len), dtype=np.int8)
+        for i in range(self.n_lanes):
+            for start, end in self.blockages[i]:
+                grid[i, start:end] = -2
+            grid[i, self.positions[i]] = self.velocities[i]
+        return grid
+
+    def car_count(self):
+        return sum(len(positions) for positions in self.positions)
+
+    def add_blockage(self, lane, start, end):
+        self.blockages[lane] = np.vstack((self.blockages[lane], [start, end]))
+        self.blockages[lane] = self.blockages[lane][np.argsort(
+            self.blockages[lane][:, 0])]
+
+    def is_blocked(self, lane, cells):
+        if len(self.blockages[lane]) == 0:
+            return np.zeros(len(cells), dtype=bool)
+        starts, ends = self.blockages[lane].T
+        index = np.searchsorted(starts, cells, side="right") - 1
+        return (0 <= index) & (cells < ends[index])
+
+    def block_distance(self, lane, cells):
+        # Distance to the first blocked cell ahead of each cell, lane_len if
+        # the lane has no blockage.
+        starts = self.blockages[lane][:, 0]
+        if len(starts) == 0:
+            return np.full(len(cells), self.lane_len)
+        index = np.searchsorted(starts, cells, side="right")
+        ahead = starts[index % len(starts)]
+        return (ahead - cells - 1) % self.lane_len + 1
+
+    def block_behind(self, lane, cells):
+        # Distance to the last blocked cell behind each cell, lane_len if
+        # the lane has no blockage.
+        ends = self.blockages[lane][:, 1]
+        if len(ends) == 0:
+            return np.full(len(cells), self.lane_len)
+        index = np.searchsorted(ends, cells, side="right") - 1
+        return (cells - ends[index]) % self.lane_len + 1
+
+    def car_distance(self, lane, cells):
+        # Distance from each cell to the nearest car strictly ahead of and
+        # strictly behind it, along with the index of the car behind.
+        positions = self.positions[lane]
+        if len(positions) == 0:
+            full = np.full(len(cells), self.lane_len)
+            return full, full, np.zeros(len(cells), dtype=int)
+        index = np.searchsorted(positions, cells, side="right")
+        ahead = (positions[index % len(positions)] - cells -
+                 1) % self.lane_len + 1
+        index = np.searchsorted(positions, cells, side="left") - 1
+        behind = (cells - positions[index] - 1) % self.lane_len + 1
+        return ahead, behind, index % len(positions)
+
+    def has_car(self, lane, cells):
+        positions = self.positions[lane]
+        if len(positions) == 0:
+            return np.zeros(len(cells), dtype=bool)
+        index = np.searchsorted(positions, cells) % len(positions)
+        return positions[index] == cells
+
+    def front_gaps(self, lane):
+        positions = self.positions[lane]
+        gaps = self.car_distance(lane, positions)[0]
+        return np.minimum(gaps, self.block_distance(lane, positions))
+
+    def update_velocity(self, prob, max_velocity):
+        for i in range(self.n_lanes):
+            velocity = np.minimum(
+                np.minimum(self.velocities[i] + 1, max_velocity),
+                self.front_gaps(i) - 1)
+            velocity -= (1 <= velocity) & (self.rng.random(len(velocity)) <
+                                           prob)
+            self.velocities[i] = velocity
+
+    def update_position(self):
+        flow = 0
+        for i in range(self.n_lanes):
+            positions = self.positions[i] + self.velocities[i]
+
+            # Cars never overtake, so wrapping only rotates the sorted order
+            wrapped = np.count_nonzero(self.lane_len <= positions)
+            flow += wrapped
+            self.positions[i] = np.roll(positions % self.lane_len, wrapped)
+            self.velocities[i] = np.roll(self.velocities[i], wrapped)
+        return flow
+
+    def merge(self):
+        # Cars stopped directly in front of a blockage move to the free cell
+        # beside them, trying the lane above first. Returns the number of
+        # cars that merged.
+        merges = 0
+        for i in range(self.n_lanes):
+            stuck = np.nonzero((self.velocities[i] == 0) & (
+                self.block_distance(i, self.positions[i]) == 1))[0]
+            for index in stuck[::-1]:
+                cell = self.positions[i][index:index + 1]
+                for new_lane in (i + 1, i - 1):
+                    if (0 <= new_lane < self.n_lanes
+                            and not self.is_blocked(new_lane, cell)[0]
+                            and not self.has_car(new_lane, cell)[0]):
+                        self.apply_moves({(i, new_lane): np.isin(
+                            self.positions[i], cell)},
+                                         velocity=1)
+                        merges += 1
+                        break
+        return merges
+
+    def apply_moves(self, moves, velocity=None):
+        # Moves the cars flagged in each (lane, new_lane) mask sideways,
+        # keeping every lane sorted.
+        leaving = [np.zeros(len(p), dtype=bool) for p in self.positions]
+        incoming = [[] for _ in range(self.n_lanes)]
+        for (lane, new_lane), mask in moves.items():
+            leaving[lane] |= mask
+            velocities = self.velocities[lane][mask]
+            if velocity is not None:
+                velocities = np.maximum(velocities, velocity)
+            incoming[new_lane].append((self.positions[lane][mask],
+                                       velocities))
+
+        for i in range(self.n_lanes):
+            if not incoming[i] and not leaving[i].any():
+                continue
+            positions = np.concatenate([self.positions[i][~leaving[i]]] +
+                                       [p for p, _ in incoming[i]])
+            velocities = np.concatenate([self.velocities[i][~leaving[i]]] +
+                                        [v for _, v in incoming[i]])
+            order = np.argsort(positions, kind="stable")
+            self.positions[i] = positions[order]
+            self.velocities[i] = velocities[order]
+
+    def update_lanes(self, prob, max_velocity):
+        # Returns the number of lane changes attempted and made
+        if self.n_lanes == 1:
+            return 0, 0
+
+        attempted = 0
+        moves = {}
+        for i in range(self.n_lanes):
+            positions = self.positions[i]
+            draws = self.rng.random((3, len(positions)))
+            direction = np.where(draws[1] < 0.5, -1, 1)
+            trying = (prob <= draws[0]) & (draws[2] < prob)
+            attempted += np.count_nonzero(trying & (0 <= i + direction) &
+                                          (i + direction < self.n_lanes))
+            velocity = np.minimum(self.velocities[i] + 1, max_velocity)
+            gaps = self.front_gaps(i)
+
+            for new_lane in (i - 1, i + 1):
+                switching = trying & (i + direction == new_lane)
+                if not 0 <= new_lane < self.n_lanes or not switching.any():
+                    continue
+                cells = positions[switching]
+                ahead, behind, index = self.car_distance(new_lane, cells)
+                ahead = np.minimum(ahead,
+                                   self.block_distance(new_lane, cells))
+                behind_velocity = self.velocities[new_lane][index] if len(
+                    self.velocities[new_lane]) else 0
+
+                safe = ((behind > np.minimum(behind_velocity + 1,
+                                             max_velocity)) |
+                        (self.block_behind(new_lane, cells) < behind))
+                gain = np.minimum(velocity[switching], ahead - 1) >= \
+                    np.minimum(velocity[switching], gaps[switching] - 1)
+                free = ~self.has_car(new_lane, cells) & ~self.is_blocked(
+                    new_lane, cells)
+                switching[switching] = safe & gain & free
+                moves[(i, new_lane)] = switching
+
+        # Two cars aiming for the same cell: the one from the lower lane wins
+        for i in range(1, self.n_lanes - 1):
+            if (i - 1, i) in moves and (i + 1, i) in moves:
+                upward = self.positions[i - 1][moves[(i - 1, i)]]
+                downward = moves[(i + 1, i)]
+                downward[downward] = ~np.isin(
+                    self.positions[i + 1][downward], upward)
+
+        self.apply_moves(moves)
+        return int(attempted), sum(
+            int(np.count_nonzero(mask)) for mask in moves.values())
+
+
+class SparseNSModel(NSModel):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The sparse state brings its own kernels, whatever the backend
+        self.backend = get_backend("python")
+
+    def initialize_highway(self):
+        self.state = SparseHighway(self.n_lanes, self.lane_len, self.rng)
+        self.populate_highway()
+
+    @property
+    def highway(self):
+        return self.state.to_grid()
+
+    @highway.setter
+    def highway(self, grid):
+        self.state = SparseHighway.from_grid(grid, self.rng)
+
+    def populate_highway(self):
+        n_cars = int(self.lane_len * self.lane_density)
+        for lane in range(0, self.n_lanes):
+            free = np.ones(self.lane_len, dtype=bool)
+            for start, end in self.state.blockages[lane]:
+                free[start:end] = False
+            valid_range = np.nonzero(free)[0]
+            cells = np.sort(
+                self.rng.choice(valid_range,
+                                size=min(n_cars, len(valid_range)),
+                                replace=False))
+            self.state.positions[lane] = cells
+            self.state.velocities[lane] = self.rng.integers(
+                0, self.max_velocity + 1, size=len(cells))
+
+    def car_count(self):
+        return self.state.car_count()
+
+    def lane_velocity(self):
+        return np.array(
+            [velocities.mean() for velocities in self.state.velocities])
+
+    def update_lanes(self):
+        return self.state.update_lanes(self.prob, self.max_velocity)
+
+    def update_velocity(self):
+        self.state.update_velocity(self.prob, self.max_velocity)
+
+    def update_position(self):
+        self.flow_count += self.state.update_position()
+
+
+class SparseZipper(SparseNSModel, Zipper):
+    def initialize_highway(self):
+        self.state = SparseHighway(self.n_lanes, self.lane_len, self.rng)
+        self.block_lanes()
+        self.populate_highway()
+
+    def block_lanes(self):
+        blocked_len = int(self.portion_blocked * self.lane_len)
+        blocked_lanes = self.rng.choice(self.n_lanes,
+                                        size=self.n_blocked,
+                                        replace=False)
+        for lane in blocked_lanes:
+            pt_one = self.rng.integers(0, self.lane_len)
+            pt_two = (pt_one + blocked_len) % self.lane_len
+            start = pt_one if pt_one < pt_two else pt_two
+            end = pt_two if pt_one < pt_two else pt_one
+            indices = np.arange(start, end)[:blocked_len]
+            self.blockages[lane] = indices
+            if len(indices):
+                self.state.add_blockage(lane, start, start + len(indices))
+
+    def merge_cars(self):
+        return self.state.merge()
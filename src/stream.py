@@ -0,0 +1,209 @@
+import argparse
+import asyncio
+import struct
+
+import numpy as np
+
+from src.model import NSModel
+from src.observables import road_observables
+from src.zipper import Zipper
+
+# Live view of a running model over a local socket. The model is stepped
+# in a worker thread and only its latest frame is kept; every subscriber
+# is sent that frame as the cells changed since the last frame it got, so
+# a slow subscriber skips frames instead of queueing them and never holds
+# up the simulation or the other subscribers.
+#
+# Messages are a uint32 length followed by a header and a body, all
+# little-endian. The header is the message kind (KEY or DELTA), frame
+# number, step, frames dropped for this subscriber since its previous
+# message, lanes, lane length, the number of cells in the body and the
+# metrics (mean velocity, flow per step, cars, jam fraction). A KEY body is
+# the whole int8 road; a DELTA body is the uint32 flat indices of the
+# changed cells followed by their int8 values.
+
+LENGTH = struct.Struct("<I")
+HEADER = struct.Struct("<BQQIHII4d")
+KEY, DELTA = 0, 1
+METRICS = ["velocity", "flow", "cars", "jammed"]
+MODELS = {cls.__name__: cls for cls in (NSModel, Zipper)}
+
+
+def encode(index, step, frame, base, metrics, dropped=0):
+    # A DELTA against base, the frame the subscriber holds, or a KEY when
+    # it holds none or the delta would not be smaller
+    n_lanes, lane_len = frame.shape
+    changed = None if base is None else np.flatnonzero(frame != base)
+    if changed is None or frame.size <= 5 * len(changed):
+        kind, body = KEY, frame.tobytes()
+        n_cells = frame.size
+    else:
+        kind, n_cells = DELTA, len(changed)
+        body = changed.astype("<u4").tobytes() + frame.reshape(-1)[
+            changed].tobytes()
+    header = HEADER.pack(kind, index, step, dropped, n_lanes, lane_len,
+                         n_cells, *metrics)
+    return LENGTH.pack(len(header) + len(body)) + header + body
+
+
+def decode(message, grid=None):
+    # The header of a message and the road after it, updating grid in place
+    # for a DELTA
+    kind, index, step, dropped, n_lanes, lane_len, n_cells, *metrics = \
+        HEADER.unpack_from(message)
+    body = memoryview(message)[HEADER.size:]
+    if kind == KEY:
+        grid = np.frombuffer(body, dtype=np.int8).reshape(n_lanes,
+                                                          lane_len).copy()
+    else:
+        cells = np.frombuffer(body[:4 * n_cells], dtype="<u4")
+        grid.reshape(-1)[cells] = np.frombuffer(body[4 * n_cells:],
+                                                dtype=np.int8)
+    header = {
+        "index": index,
+        "step": step,
+        "dropped": dropped,
+        **dict(zip(METRICS, metrics))
+    }
+    return header, grid
+
+
+async def read_frames(reader):
+    # The (header, road) of every message of a stream until it ends. The
+    # road is the same array, updated, between KEY messages.
+    grid = None
+    while True:
+        try:
+            size, = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+            message = await reader.readexactly(size)
+        except asyncio.IncompleteReadError:
+            return
+        header, grid = decode(message, grid)
+        yield header, grid
+
+
+class StreamServer:
+    # Steps the model `every` steps per frame, at most one frame per
+    # `interval` seconds, and publishes the frames to every subscriber of
+    # the socket at `address`: a path for a Unix socket, or (host, port).
+    # high_water is the unsent bytes a subscriber may have buffered before
+    # it is made to wait and skip frames.
+    def __init__(self, model, every=1, interval=0.0, high_water=1 << 16):
+        self.model = model
+        self.every = every
+        self.interval = interval
+        self.high_water = high_water
+        self.latest = None
+        self.index = -1
+        self.finished = False
+        self.updated = None
+        self.server = None
+        self.subscribers = 0
+
+    async def start(self, address):
+        self.updated = asyncio.Condition()
+        if isinstance(address, str):
+            self.server = await asyncio.start_unix_server(self.serve, address)
+        else:
+            self.server = await asyncio.start_server(self.serve, *address)
+        return self
+
+    def advance(self):
+        # One frame's worth of steps, run in a worker thread
+        flow = self.model.advance(self.every, ["flow"],
+                                  every=self.every)["flow"][0]
+        frame = np.array(self.model.highway, dtype=np.int8)
+        values = road_observables(frame, ["velocity", "cars", "jammed"])
+        metrics = (values["velocity"], flow, values["cars"], values["jammed"])
+        return frame, metrics
+
+    async def run(self, n_frames=None):
+        # Simulates until n_frames frames are published, or forever
+        loop = asyncio.get_running_loop()
+        step = 0
+        try:
+            while n_frames is None or self.index + 1 < n_frames:
+                started = loop.time()
+                frame, metrics = await loop.run_in_executor(
+                    None, self.advance)
+                step += self.every
+                async with self.updated:
+                    self.index += 1
+                    self.latest = (self.index, step, frame, metrics)
+                    self.updated.notify_all()
+                await asyncio.sleep(
+                    max(self.interval - (loop.time() - started), 0))
+        finally:
+            async with self.updated:
+                self.finished = True
+                self.updated.notify_all()
+
+    async def serve(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=self.high_water)
+        self.subscribers += 1
+        base, seen = None, -1
+        try:
+            while True:
+                async with self.updated:
+                    await self.updated.wait_for(
+                        lambda: seen < self.index or self.finished)
+                if self.index == seen:
+                    break
+                index, step, frame, metrics = self.latest
+                dropped = 0 if base is None else index - seen - 1
+                writer.write(
+                    encode(index, step, frame, base, metrics, dropped))
+                # Waits only this subscriber while its buffer drains; the
+                # frames published meanwhile are skipped
+                await writer.drain()
+                base, seen = frame, index
+        except ConnectionError:
+            pass
+        finally:
+            self.subscribers -= 1
+            writer.close()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+async def serve(model, address, n_frames=None, every=1, interval=0.0):
+    server = await StreamServer(model, every, interval).start(address)
+    try:
+        await server.run(n_frames)
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Stream a running model to local subscribers")
+    parser.add_argument("address", help="Unix socket path, or host:port")
+    parser.add_argument("--model", choices=sorted(MODELS), default="Zipper")
+    parser.add_argument("--frames", type=int, default=None)
+    parser.add_argument("--every", type=int, default=1)
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--n-lanes", type=int, default=3)
+    parser.add_argument("--lane-len", type=int, default=200)
+    parser.add_argument("--density", type=float, default=0.3)
+    parser.add_argument("--backend", default="numpy")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    model = MODELS[args.model](n_lanes=args.n_lanes,
+                               lane_len=args.lane_len,
+                               lane_density=args.density,
+                               backend=args.backend,
+                               seed=args.seed)
+    address = args.address
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        address = (host, int(port))
+    asyncio.run(serve(model, address, args.frames, args.every,
+                      args.interval))
+
+
+if __name__ == "__main__":
+    main()
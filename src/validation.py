@@ -1,248 +1,546 @@
-from concurrent.futures import ProcessPoolExecutor as PoolExecutor
-from multiprocessing import cpu_count
+import os
 
-import matplotlib.pyplot as plt
 import numpy as np
 
+from src.cache import ResultCache
 from src.model import NSModel
+from src.points import (ensemble_flow, ensemble_velocity, init_model,
+                        model_flow, model_series, model_velocity, warm_walk)
+from src.scheduler import run_tasks
+from src.shared import SharedResults
 from src.zipper import Zipper
 
 
-def plt_helper(title, xlabel, ylabel, save=False):
-    plt.title(title)
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
-    plt.legend(loc="upper right")
-
-    if save:
-        plt.savefig(f"./figures/{title}.png", format="png")
-    else:
-        plt.show()
-
-    plt.cla()
-
-
-def init_model(model,
-               prob=0.5,
-               n_lanes=3,
-               lane_len=200,
-               max_velocity=5,
-               lane_density=0.5,
-               lane_changes=False,
-               initialize_highway=True,
-               n_blocked=1,
-               portion_blocked=0.2):
-    if type(model).__name__ == "NSModel":
-        return NSModel(prob=prob,
-                       n_lanes=n_lanes,
-                       lane_len=lane_len,
-                       max_velocity=max_velocity,
-                       lane_density=lane_density,
-                       lane_changes=lane_changes,
-                       initialize_highway=initialize_highway)
-    return Zipper(prob=prob,
-                  n_lanes=n_lanes,
-                  lane_len=lane_len,
-                  max_velocity=max_velocity,
-                  lane_density=lane_density,
-                  lane_changes=lane_changes,
-                  n_blocked=n_blocked,
-                  portion_blocked=portion_blocked)
-
-
-def velocity_to_density(delta=0.01, steps=200, model=NSModel):
-    mean_velocity = {"0.0": [], "0.5": []}
+def publish(title, xlabel, ylabel, x=None, curves=None, image=None,
+            plot=True, errors=None):
+    # Writes the data behind a figure to ./results/<title>.npz and, with
+    # plot set, renders it to ./figures. Plotting is imported only here, so
+    # sweeps and their workers never load matplotlib.
+    path = save_results(title, xlabel, ylabel, x, curves, image, errors)
+    if plot:
+        from src.plots import plot_results
+        plot_results(path)
+    return path
+
+
+def save_results(title, xlabel, ylabel, x=None, curves=None, image=None,
+                 errors=None, directory="./results"):
+    # Curves are a dict of label -> values over x, errors the same for the
+    # half-widths of their error bars
+    os.makedirs(directory, exist_ok=True)
+    arrays = {"title": title, "xlabel": xlabel, "ylabel": ylabel}
+    if curves is not None:
+        arrays["x"] = np.asarray(x)
+        arrays["labels"] = np.array(list(curves.keys()))
+        arrays["curves"] = np.array(list(curves.values()), dtype=float)
+    if errors is not None:
+        arrays["errors"] = np.array([errors[label] for label in curves],
+                                    dtype=float)
+    if image is not None:
+        arrays["image"] = np.asarray(image)
+    path = os.path.join(directory, f"{title}.npz")
+    np.savez(path, **arrays)
+    return path
+
+
+def sweep(fn, parameter, values, densities, replicas=1, label="sweep",
+          workers=None, seed=0, cache=None, stack=1, **params):
+    # Runs fn for every (value, density, replica) combination, with value
+    # passed as the `parameter` argument, and returns the replica-averaged
+    # curve over densities for each value. With stack > 1, every task gets
+    # up to `stack` consecutive densities as a list and returns one value
+    # for each, as the ensemble functions do.
+    chunks = [
+        list(densities[start:start + stack])
+        for start in range(0, len(densities), stack)
+    ]
+    tasks = [{
+        parameter: value,
+        "lane_density": chunk if 1 < stack else chunk[0],
+        **params
+    } for value in values for chunk in chunks for _ in range(replicas)]
+    results = run_tasks(fn,
+                        tasks,
+                        workers=workers,
+                        seed=seed,
+                        label=label,
+                        cache=cache)
+    results = np.concatenate([
+        np.mean(np.reshape(results[start:start + replicas], (replicas, -1)),
+                axis=0) for start in range(0, len(tasks), replicas)
+    ])
+    results = np.reshape(results, (len(values), len(densities)))
+    return dict(zip(values, results))
+
+
+def series_sweep(densities,
+                 replicas=1,
+                 steps=100,
+                 frames=False,
+                 model=NSModel,
+                 label="series",
+                 workers=None,
+                 seed=0,
+                 **params):
+    # Runs model_series for every (density, replica) pair and returns the
+    # SharedResults its workers wrote into, with rows in that order. Close
+    # it (or use it as a context manager) once done with the arrays.
+    tasks = [{
+        "model": model,
+        "lane_density": density,
+        "steps": steps,
+        **params
+    } for density in densities for _ in range(replicas)]
+    shape = (steps, params.get("n_lanes", 3), params.get("lane_len", 200))
+    fields = {"velocity": (steps, float), "flow": (steps, np.int64)}
+    if frames:
+        fields["frames"] = (shape, np.int8)
+
+    results = SharedResults(len(tasks), fields)
+    try:
+        run_tasks(model_series,
+                  tasks,
+                  workers=workers,
+                  seed=seed,
+                  label=label,
+                  shared=results)
+    except BaseException:
+        results.close()
+        raise
+    return results
+
+
+def warm_sweep(parameter, values, densities, chains=1, label="sweep",
+               workers=None, seed=0, cache=None, **params):
+    # Like sweep, but each task is one warm_walk over all densities for one
+    # (value, chain) pair.
+    tasks = [{
+        parameter: value,
+        "densities": list(densities),
+        **params
+    } for value in values for _ in range(chains)]
+    results = run_tasks(warm_walk,
+                        tasks,
+                        workers=workers,
+                        seed=seed,
+                        label=label,
+                        cache=cache)
+    results = np.reshape(results, (len(values), chains, len(densities)))
+    return dict(zip(values, results.mean(axis=1)))
+
+
+def quadratic_at(xs, ys, x):
+    # The parabola through three points, evaluated at x
+    x0, x1, x2 = xs
+    return (ys[0] * (x - x1) * (x - x2) / ((x0 - x1) * (x0 - x2)) +
+            ys[1] * (x - x0) * (x - x2) / ((x1 - x0) * (x1 - x2)) +
+            ys[2] * (x - x0) * (x - x1) / ((x2 - x0) * (x2 - x1)))
+
+
+def refinement(points, mean, stderr, rtol, z=1.96):
+    # Midpoints of the intervals between grid indices `points` where any
+    # curve (a column of mean) bends or fluctuates: the parabola through the
+    # neighbouring points strays from the chord at the midpoint by more than
+    # rtol times the curve's range plus the noise of the ends, or an end's
+    # error bar is over twice the curve's median one, as around the
+    # critical density.
+    x = np.array(points, dtype=float)
+    with np.errstate(invalid="ignore"):
+        bound = rtol * (np.nanmax(mean, axis=0) - np.nanmin(mean, axis=0))
+        typical = np.nanmedian(stderr, axis=0)
+    midpoints = []
+    for i in range(len(points) - 1):
+        if points[i + 1] - points[i] < 2:
+            continue
+        middle = (x[i] + x[i + 1]) / 2
+        chord = (mean[i] + mean[i + 1]) / 2
+        deviation = np.zeros(mean.shape[1])
+        for first in (i - 1, i):
+            if 0 <= first and first + 2 < len(points):
+                deviation = np.fmax(
+                    deviation,
+                    np.abs(
+                        quadratic_at(x[first:first + 3],
+                                     mean[first:first + 3], middle) - chord))
+        noise = np.fmax(stderr[i], stderr[i + 1])
+        if (len(points) < 3 or np.any(deviation > bound + z * noise)
+                or np.any(noise > 2 * typical)):
+            midpoints.append((points[i] + points[i + 1]) // 2)
+    return midpoints
+
+
+def adaptive_sweep(fn, parameter, values, delta=0.01, coarse=0.1,
+                   replicas=4, rtol=0.02, max_rounds=8, label="sweep",
+                   workers=None, seed=0, cache=None, **params):
+    # Like sweep over densities 0 to 1, but starting from a grid `coarse`
+    # apart and halving, round by round, only the intervals that refinement
+    # picks, down to `delta`. Densities are points of np.arange(0, 1 +
+    # delta, delta), so they share cached results with uniform sweeps.
+    # Returns the densities and, for each value, the replica mean and its
+    # standard error there.
+    n_points = int(round(1 / delta))
+    step = max(int(round(coarse / delta)), 1)
+    new = sorted(set(range(0, n_points + 1, step)) | {n_points})
+    samples = {}
+    for round_ in range(max_rounds + 1):
+        tasks = [{
+            parameter: value,
+            "lane_density": index * delta,
+            **params
+        } for index in new for value in values for _ in range(replicas)]
+        results = run_tasks(fn,
+                            tasks,
+                            workers=workers,
+                            seed=seed,
+                            label=f"{label} round {round_}",
+                            cache=cache)
+        samples.update(
+            zip(new, np.reshape(results, (len(new), len(values), replicas))))
+
+        points = sorted(samples)
+        results = np.array([samples[index] for index in points])
+        mean = results.mean(axis=2)
+        stderr = results.std(axis=2, ddof=1) / np.sqrt(replicas) \
+            if 1 < replicas else np.zeros_like(mean)
+        new = refinement(points, mean, stderr, rtol)
+        if not new:
+            break
+
+    densities = np.array(points) * delta
+    return (densities, dict(zip(values, mean.T)), dict(zip(values,
+                                                           stderr.T)))
+
+
+def velocity_to_density(delta=0.01,
+                        steps=200,
+                        model=NSModel,
+                        workers=None,
+                        seed=0,
+                        cache=None,
+                        plot=True,
+                        warmup=100,
+                        tol=0.01,
+                        warm_start=False,
+                        settle=50,
+                        adaptive=False,
+                        stack=16):
+    # Ensembles only stack NSModel roads, other models run one per task.
+    # NSModel tasks run `stack` densities in one ensemble.
+    ensemble = model is NSModel
+    fn = ensemble_velocity if ensemble else model_velocity
+    batch = {} if ensemble else {"model": model}
     densities = np.arange(0, 1 + delta, delta)
-
-    for prob in mean_velocity.keys():
-        for density in densities:
-            curr_values = []
-            model = init_model(NSModel, prob=float(prob), lane_density=density)
-            for _ in range(0, steps + 1):
-                for _ in range(0, 10):
-                    model.simulate()
-                    curr_values.append(model.highway_velocity())
-            mean_velocity[prob].append(np.average(curr_values))
-
-    for prob in mean_velocity.keys():
-        plt.plot(densities, mean_velocity[prob], label=f"p={prob}")
-
-    plt_helper("Mean Velocity vs. Density", "Density (cars/lane)",
-               "Mean Velocity (m/s)", True)
-
-
-def flow_rate_to_density(delta=0.01, steps=100, model=NSModel):
+    errors = None
+    if adaptive:
+        densities, mean_velocity, errors = adaptive_sweep(
+            fn,
+            "prob", [0.0, 0.5],
+            delta=delta,
+            label="velocity_to_density",
+            workers=workers,
+            seed=seed,
+            cache=cache,
+            steps=steps + 1,
+            warmup=warmup,
+            tol=tol,
+            lane_len=200,
+            **batch)
+    elif warm_start:
+        mean_velocity = warm_sweep("prob", [0.0, 0.5],
+                                   densities,
+                                   label="velocity_to_density",
+                                   workers=workers,
+                                   seed=seed,
+                                   cache=cache,
+                                   ensemble=ensemble,
+                                   max_steps=(steps + 1) * 10,
+                                   warmup=warmup,
+                                   settle=settle,
+                                   tol=tol,
+                                   lane_len=200,
+                                   **batch)
+    else:
+        mean_velocity = sweep(fn,
+                              "prob", [0.0, 0.5],
+                              densities,
+                              label="velocity_to_density",
+                              workers=workers,
+                              seed=seed,
+                              cache=cache,
+                              stack=stack if ensemble else 1,
+                              steps=steps + 1,
+                              warmup=warmup,
+                              tol=tol,
+                              lane_len=200,
+                              **batch)
+
+    publish("Mean Velocity vs. Density",
+            "Density (cars/lane)",
+            "Mean Velocity (m/s)",
+            densities,
+            {f"p={prob}": values
+             for prob, values in mean_velocity.items()},
+            plot=plot,
+            errors=None if errors is None else
+            {f"p={prob}": 1.96 * values
+             for prob, values in errors.items()})
+
+
+def flow_rate_to_density(delta=0.01,
+                         steps=100,
+                         model=NSModel,
+                         workers=None,
+                         seed=0,
+                         cache=None,
+                         plot=True,
+                         warm_start=False,
+                         settle=50,
+                         adaptive=False):
     lane_len = 200
-    flow_rates = {"1": [], "3": [], "5": []}
+    ensemble = model is NSModel
+    fn = ensemble_flow if ensemble else model_flow
+    batch = {} if ensemble else {"model": model}
     densities = np.arange(0, 1 + delta, delta)
-
-    for max_velocity in flow_rates.keys():
-        for density in densities:
-            curr_values = []
-            for _ in range(0, steps + 1):
-                model = init_model(model,
-                                   max_velocity=int(max_velocity),
-                                   lane_density=density)
-                for _ in range(0, lane_len):
-                    model.simulate()
-                curr_values.append(model.flow_count / lane_len)
-            flow_rates[max_velocity].append(np.average(curr_values))
-
-    for max_velocity in flow_rates.keys():
-        plt.plot(densities,
-                 flow_rates[max_velocity],
-                 label=f"Max Velocity={max_velocity}")
-
-    plt_helper("Flow Rate vs. Density", "Density (cars/lane)",
-               "Flow Rate (cars/step)", True)
-
-
-def cars_per_site(steps=200, model=NSModel):
+    errors = None
+    if adaptive:
+        # Four tasks per point for the error bars, each an ensemble of a
+        # quarter of the repetitions
+        repetitions = {
+            "replicas": 4,
+            "repeats": max((steps + 1) // 4, 1)
+        } if ensemble else {
+            "replicas": steps + 1
+        }
+        densities, flow_rates, errors = adaptive_sweep(
+            fn,
+            "max_velocity", [1, 3, 5],
+            delta=delta,
+            label="flow_rate_to_density",
+            workers=workers,
+            seed=seed,
+            cache=cache,
+            lane_len=lane_len,
+            **repetitions,
+            **batch)
+    elif warm_start:
+        # One walk over an ensemble of all repetitions, or one walk per
+        # repetition for other models
+        repetitions = {"replicas": steps + 1} if ensemble else {
+            "chains": steps + 1
+        }
+        flow_rates = warm_sweep("max_velocity", [1, 3, 5],
+                                densities,
+                                label="flow_rate_to_density",
+                                workers=workers,
+                                seed=seed,
+                                cache=cache,
+                                ensemble=ensemble,
+                                observe="flow",
+                                max_steps=lane_len,
+                                warmup=lane_len,
+                                settle=settle,
+                                lane_len=lane_len,
+                                **repetitions,
+                                **batch)
+    else:
+        # Each NSModel task batches all repetitions of one point into one
+        # ensemble, other models run one task per repetition
+        repetitions = {"repeats": steps + 1} if ensemble else {
+            "replicas": steps + 1
+        }
+        flow_rates = sweep(fn,
+                           "max_velocity", [1, 3, 5],
+                           densities,
+                           label="flow_rate_to_density",
+                           workers=workers,
+                           seed=seed,
+                           cache=cache,
+                           lane_len=lane_len,
+                           **repetitions,
+                           **batch)
+
+    publish("Flow Rate vs. Density",
+            "Density (cars/lane)",
+            "Flow Rate (cars/step)",
+            densities, {
+                f"Max Velocity={max_velocity}": values
+                for max_velocity, values in flow_rates.items()
+            },
+            plot=plot,
+            errors=None if errors is None else {
+                f"Max Velocity={max_velocity}": 1.96 * values
+                for max_velocity, values in errors.items()
+            })
+
+
+def cars_per_site(steps=200, model=NSModel, plot=True):
     model = init_model(NSModel)
 
-    values = []
-    for _ in range(0, steps):
-        curr_values = []
+    values = np.empty((steps, model.lane_len), dtype=np.int8)
+    for step in range(0, steps):
         model.simulate()
-        for v in model.highway[0]:
-            curr_values.append(v)
-        values.append(curr_values)
+        values[step] = model.highway[0]
 
-    plt.imshow(values, cmap="Blues", interpolation="nearest")
-    plt_helper("Cars per Site", "Site", "Step", True)
+    publish("Cars per Site", "Site", "Step", image=values, plot=plot)
 
 
-def velocity_to_density_lanes(delta=0.01, steps=100, prob=0.5, model=NSModel):
-    mean_velocity = {"1": [], "2": [], "3": [], "4": []}
+def velocity_to_density_lanes(delta=0.01,
+                              steps=100,
+                              prob=0.5,
+                              model=NSModel,
+                              workers=None,
+                              seed=0,
+                              cache=None,
+                              plot=True,
+                              warmup=100,
+                              tol=0.01):
     densities = np.arange(0, 1 + delta, delta)
-
-    for lane in mean_velocity.keys():
-        for density in densities:
-            curr_values = []
-            model = init_model(model,
-                               prob=float(prob),
-                               n_lanes=int(lane),
-                               lane_density=density,
-                               lane_changes=True,
-                               n_blocked=0 if int(lane) == 1 else 1,
-                               portion_blocked=0.2)
-            for _ in range(0, steps):
-                for _ in range(0, 10):
-                    model.simulate()
-                    curr_values.append(model.highway_velocity())
-            mean_velocity[lane].append(np.average(curr_values))
-
-    for lane in mean_velocity.keys():
-        plt.plot(densities, mean_velocity[lane], label=f"N={lane}")
-
-    plt_helper(
-        "Mean Velocity vs. Density for N highway lanes - {type(model).__name__}",
-        "Density (cars/lane)", "Mean Velocity (m/s)", True)
+    mean_velocity = {}
+    for lane in [1, 2, 3, 4]:
+        mean_velocity.update(
+            sweep(model_velocity,
+                  "n_lanes", [lane],
+                  densities,
+                  label=f"velocity_to_density_lanes N={lane}",
+                  workers=workers,
+                  seed=seed + lane,
+                  cache=cache,
+                  steps=steps,
+                  warmup=warmup,
+                  tol=tol,
+                  model=model,
+                  prob=float(prob),
+                  lane_changes=True,
+                  n_blocked=0 if lane == 1 else 1,
+                  portion_blocked=0.2))
+
+    publish(f"Mean Velocity vs. Density for N highway lanes - "
+            f"{model.__name__}",
+            "Density (cars/lane)",
+            "Mean Velocity (m/s)",
+            densities,
+            {f"N={lane}": values
+             for lane, values in mean_velocity.items()},
+            plot=plot)
 
 
 def velocity_to_density_speedlim(steps=100,
                                  prob=0.5,
                                  delta=0.01,
-                                 model=NSModel):
-    mean_velocity = {"2": [], "4": [], "6": [], "8": []}
+                                 model=NSModel,
+                                 workers=None,
+                                 seed=0,
+                                 cache=None,
+                                 plot=True,
+                                 warmup=100,
+                                 tol=0.01):
     densities = np.arange(0.01, 1 + delta, delta)
-
-    for speedlim in mean_velocity.keys():
-        for density in densities:
-            curr_values = []
-            model = init_model(model,
-                               prob=float(prob),
-                               max_velocity=int(speedlim),
-                               n_lanes=2,
-                               lane_density=density,
-                               lane_changes=True,
-                               n_blocked=1,
-                               portion_blocked=0.2)
-            for _ in range(0, steps):
-                for _ in range(0, 10):
-                    model.simulate()
-                    curr_values.append(model.highway_velocity())
-            mean_velocity[speedlim].append(np.average(curr_values))
-
-    for speedlim in mean_velocity.keys():
-        plt.plot(densities,
-                 mean_velocity[speedlim],
-                 label=f"Speed limit={speedlim} (m/s)")
-
-    plt_helper(
-        "Mean Velocity vs. Density for varying speed limits - {type(model).__name__}",
-        "Density (cars/lane)", "Mean Velocity (m/s)", True)
+    mean_velocity = sweep(model_velocity,
+                          "max_velocity", [2, 4, 6, 8],
+                          densities,
+                          label="velocity_to_density_speedlim",
+                          workers=workers,
+                          seed=seed,
+                          cache=cache,
+                          steps=steps,
+                          warmup=warmup,
+                          tol=tol,
+                          model=model,
+                          prob=float(prob),
+                          n_lanes=2,
+                          lane_changes=True,
+                          n_blocked=1,
+                          portion_blocked=0.2)
+
+    publish(f"Mean Velocity vs. Density for varying speed limits - "
+            f"{model.__name__}",
+            "Density (cars/lane)",
+            "Mean Velocity (m/s)",
+            densities, {
+                f"Speed limit={speedlim} (m/s)": values
+                for speedlim, values in mean_velocity.items()
+            },
+            plot=plot)
 
 
 def flow_to_density(steps=100,
                     prob=0.5,
                     delta=0.05,
                     lane_len=200,
-                    model=NSModel):
-    flow_rates = {"1": [], "2": [], "3": [], "4": []}
+                    model=NSModel,
+                    workers=None,
+                    seed=0,
+                    cache=None,
+                    plot=True,
+                    warm_start=False,
+                    settle=50):
     densities = np.arange(0.05, 1 + delta, delta)
-
-    for lane in flow_rates:
-        for density in densities:
-            curr_values = []
-            for _ in range(0, steps + 1):
-                model = init_model(model,
-                                   prob=float(prob),
-                                   n_lanes=int(lane),
-                                   lane_density=density,
-                                   lane_changes=True,
-                                   n_blocked=0 if int(lane) == 0 else 1,
-                                   portion_blocked=0.2)
-                for _ in range(0, lane_len):
-                    model.simulate()
-                curr_values.append(model.flow_count / lane_len)
-            flow_rates[lane].append(np.average(curr_values))
-
-    for lane in flow_rates.keys():
-        plt.plot(densities, flow_rates[lane], label=f"N={lane}")
-
-    plt_helper(
-        "Flow Rate vs. Density for N highway lanes - {type(model).__name__}",
-        "Density (cars/lane)", "Flow Rate (cars/step)", True)
-
-
-def validation():
-    futures = []
-    with PoolExecutor(max_workers=cpu_count()) as executor:
-        futures.append(executor.submit(velocity_to_density()))
-        futures.append(executor.submit(flow_rate_to_density()))
-        futures.append(executor.submit(cars_per_site()))
-        executor.shutdown(wait=True)
-
-
-def main_NS():
-    futures = []
-    with PoolExecutor(max_workers=cpu_count()) as executor:
-        futures.append(
-            executor.submit(velocity_to_density_lanes(model=NSModel)))
-        futures.append(
-            executor.submit(velocity_to_density_speedlim(model=NSModel)))
-        futures.append(executor.submit(flow_to_density(model=NSModel)))
-        executor.shutdown(wait=True)
-
-
-def main_Z():
-    futures = []
-    with PoolExecutor(max_workers=cpu_count()) as executor:
-        futures.append(executor.submit(
-            velocity_to_density_lanes(model=Zipper)))
-        futures.append(
-            executor.submit(velocity_to_density_speedlim(model=Zipper)))
-        futures.append(executor.submit(flow_to_density(model=Zipper)))
-        executor.shutdown(wait=True)
+    flow_rates = {}
+    for lane in [1, 2, 3, 4]:
+        params = dict(label=f"flow_to_density N={lane}",
+                      workers=workers,
+                      seed=seed + lane,
+                      cache=cache,
+                      lane_len=lane_len,
+                      model=model,
+                      prob=float(prob),
+                      lane_changes=True,
+                      n_blocked=0 if lane == 0 else 1,
+                      portion_blocked=0.2)
+        if warm_start:
+            flow_rates.update(
+                warm_sweep("n_lanes", [lane],
+                           densities,
+                           chains=steps + 1,
+                           observe="flow",
+                           max_steps=lane_len,
+                           warmup=lane_len,
+                           settle=settle,
+                           **params))
+        else:
+            flow_rates.update(
+                sweep(model_flow,
+                      "n_lanes", [lane],
+                      densities,
+                      replicas=steps + 1,
+                      **params))
+
+    publish(f"Flow Rate vs. Density for N highway lanes - "
+            f"{model.__name__}",
+            "Density (cars/lane)",
+            "Flow Rate (cars/step)",
+            densities,
+            {f"N={lane}": values
+             for lane, values in flow_rates.items()},
+            plot=plot)
+
+
+def validation(workers=None, cache=None, plot=True):
+    velocity_to_density(workers=workers, cache=cache, plot=plot)
+    flow_rate_to_density(workers=workers, cache=cache, plot=plot)
+    cars_per_site(plot=plot)
+
+
+def main_NS(workers=None, cache=None, plot=True):
+    for experiment in (velocity_to_density_lanes,
+                       velocity_to_density_speedlim, flow_to_density):
+        experiment(model=NSModel, workers=workers, cache=cache, plot=plot)
+
+
+def main_Z(workers=None, cache=None, plot=True):
+    for experiment in (velocity_to_density_lanes,
+                       velocity_to_density_speedlim, flow_to_density):
+        experiment(model=Zipper, workers=workers, cache=cache, plot=plot)
 
 
 if __name__ == "__main__":
     import time
 
+    # Points already simulated with the same code are read from the cache
+    cache = ResultCache()
     start = time.time()
-    validation()
-    main_NS()
-    main_Z()
+    validation(cache=cache)
+    main_NS(cache=cache)
+    main_Z(cache=cache)
     end = time.time()
     print(end - start)
@@ -0,0 +1,275 @@
+from functools import lru_cache
+
+import numpy as np
+
+
+# Cells per word of the occupancy bitmaps. Gap lookups only look one word
+# ahead or behind, which covers every max_velocity below WORD.
+WORD = 64
+
+
+def occupancy_bits(rows):
+    # Occupied (car or blocked) cells of every row of a (rows, lane_len)
+    # grid packed into little-endian uint64 words, bit WORD + k of a row
+    # being cell k. The WORD bits before the row and the 2 * WORD after it
+    # hold the ring wrapped around, so scans can run past either end.
+    return np.packbits((rows != -1).take(wrapped_cells(rows.shape[-1]),
+                                         axis=-1),
+                       axis=-1,
+                       bitorder="little").view("<u8")
+
+
+@lru_cache
+def wrapped_cells(lane_len):
+    # The cell behind every bit of a row of the occupancy bitmap
+    n_words = (lane_len + 2 * WORD) // WORD + 2
+    cells = (np.arange(n_words * WORD) - WORD) % lane_len
+    cells.flags.writeable = False
+    return cells
+
+
+def bit_window(bits, rows, starts):
+    # The WORD bits of each row from bit `starts` on, lowest first. The
+    # high word is shifted in two steps so a zero shift brings in nothing.
+    index = rows * bits.shape[-1] + (starts >> 6)
+    shift = (starts & 63).astype(np.uint64)
+    words = bits.reshape(-1)
+    return (words[index] >> shift) | (
+        (words[index + 1] << np.uint64(1)) << (np.uint64(WORD - 1) - shift))
+
+
+# Set bits of every byte, for popcounts on NumPy < 2
+BYTE_BITS = np.array([bin(byte).count("1") for byte in range(256)],
+                     dtype=np.uint8)
+
+
+def table_popcount(window):
+    # Set bits of every uint64 word, summed over its bytes
+    window = np.ascontiguousarray(window, dtype=np.uint64)
+    counts = BYTE_BITS[window.view(np.uint8)].reshape(window.shape + (8,))
+    return counts.sum(axis=-1, dtype=np.uint8)
+
+
+popcount = getattr(np, "bitwise_count", table_popcount)
+
+
+def first_set(window):
+    # Index of the lowest set bit of every window, WORD for empty ones: the
+    # count of the zeros below it
+    return popcount(~window & (window - np.uint64(1)))
+
+
+def last_set(window):
+    # Index of the highest set bit of every window plus one, 0 for empty
+    # ones: the count of the bits left once it is smeared downwards (in
+    # place)
+    for shift in (1, 2, 4, 8, 16, 32):
+        window |= window >> np.uint64(shift)
+    return popcount(window)
+
+
+def distance_ahead(bits, rows, cells, lane_len):
+    # Distance from each cell to the next occupied cell ahead in its row,
+    # WORD + 1 when there is none within a word, matching NSModel.get_distance
+    # up to that bound
+    return np.minimum(
+        first_set(bit_window(bits, rows, cells + (WORD + 1))).astype(int) + 1,
+        lane_len)
+
+
+def distance_behind(bits, rows, cells, lane_len):
+    # Distance from each cell to the nearest occupied cell behind it in its
+    # row, from the word of cells before it, and whether there is one within
+    # that word
+    window = bit_window(bits, rows, cells)
+    found = window != 0
+    return np.minimum(WORD + 1 - last_set(window).astype(int),
+                      lane_len), found
+
+
+def blockage_index(highway):
+    # Static lookups for the blocked (-2) cells of a grid: the distance from
+    # every cell to the next blocked cell ahead in its lane (lane_len + 1
+    # when the lane has none), and whether the cell beside it in the lane
+    # above and below exists and is not blocked.
+    n_lanes, lane_len = highway.shape[-2:]
+    blocked = highway == -2
+    cells = np.arange(lane_len)
+    far = 3 * lane_len
+
+    distance = np.where(blocked, cells, far)
+    distance = np.concatenate((distance, distance + lane_len), axis=-1)
+    distance = np.minimum.accumulate(distance[..., ::-1], axis=-1)[..., ::-1]
+    distance = distance[..., 1:lane_len + 1] - cells
+    distance[~blocked.any(axis=-1)] = lane_len + 1
+
+    can_merge = np.zeros((2, ) + highway.shape, dtype=bool)
+    can_merge[0, ..., :-1, :] = ~blocked[..., 1:, :]
+    can_merge[1, ..., 1:, :] = ~blocked[..., :-1, :]
+    return distance, can_merge
+
+
+def per_lane(value, highway):
+    # Flattens a scalar or a parameter broadcastable to the leading (lane or
+    # replica) axes of the grid to one value per row of the (lanes,
+    # lane_len) view.
+    if np.ndim(value) == 0:
+        return value
+    return np.broadcast_to(value, highway.shape[:-1]).reshape(-1)
+
+
+def check_reach(max_velocity):
+    if WORD <= (max_velocity
+                if np.ndim(max_velocity) == 0 else np.max(max_velocity)):
+        raise ValueError(f"max_velocity must be below {WORD} for the gap "
+                         "scans of the occupancy bitmap")
+
+
+def update_velocity(highway, prob, max_velocity, rng, bits=None):
+    # `bits` is the occupancy bitmap of the grid when the caller has it
+    check_reach(max_velocity)
+    lane_len = highway.shape[-1]
+    rows = highway.reshape(-1, lane_len)
+    lanes, cells = np.nonzero(0 <= rows)
+    if bits is None:
+        bits = occupancy_bits(rows)
+    gaps = distance_ahead(bits, lanes, cells, lane_len)
+
+    prob = per_lane(prob, highway)
+    max_velocity = per_lane(max_velocity, highway)
+    if np.ndim(prob):
+        prob = prob[lanes]
+    if np.ndim(max_velocity):
+        max_velocity = max_velocity[lanes]
+
+    velocity = np.minimum(np.minimum(rows[lanes, cells] + 1, max_velocity),
+                          gaps - 1)
+    velocity -= (1 <= velocity) & (rng.random(len(velocity)) < prob)
+    rows[lanes, cells] = velocity
+
+
+def update_position(highway, hold=None, out=None):
+    # Moves every car forward by its velocity. Cars flagged in `hold` keep
+    # their cell. Returns the new grid and the per-lane count of cars that
+    # wrapped past the end of the ring. The new grid is written to `out`
+    # when given, so two grids can be swapped every step instead of
+    # allocating a new one.
+    lane_len = highway.shape[-1]
+    rows = highway.reshape(-1, lane_len)
+
+    if out is None:
+        out = np.empty_like(highway)
+    updated = out.reshape(rows.shape)
+    np.copyto(updated, -1)
+    np.copyto(updated, -2, where=rows == -2)
+    lanes, cells = np.nonzero(0 <= rows)
+    velocity = rows[lanes, cells]
+
+    moves = velocity if hold is None else np.where(
+        hold.reshape(rows.shape)[lanes, cells], 0, velocity)
+    targets = cells + moves
+    flow = np.bincount(lanes[lane_len <= targets], minlength=len(rows))
+
+    updated[lanes, targets % lane_len] = velocity
+    return out, flow.reshape(highway.shape[:-1])
+
+
+def update_lanes(highway, prob, max_velocity, rng, bits=None):
+    # Every car decides at once from the gaps of the grid before the phase:
+    # it tries to move sideways with probability (1 - prob) * prob, the
+    # target cell must be free, the car behind it must be able to stop in
+    # time and the move must not lower the speed the car can reach. When two
+    # cars aim at the same cell the one coming from the lower lane wins.
+    # `bits`, the occupancy bitmap of the grid when the caller has it, is
+    # rebuilt in place after the moves, so the velocity phase can use it.
+    # Returns the number of lane changes attempted and made.
+    n_lanes, lane_len = highway.shape[-2:]
+    if n_lanes == 1:
+        return 0, 0
+    check_reach(max_velocity)
+
+    grid = highway.reshape(-1, n_lanes, lane_len)
+    rows = grid.reshape(-1, lane_len)
+    replicas, lanes, cells = np.nonzero(0 <= grid)
+    velocity = grid[replicas, lanes, cells]
+
+    row = replicas * n_lanes + lanes
+    prob = per_lane(prob, highway)
+    max_velocity = per_lane(max_velocity, highway)
+    if np.ndim(prob):
+        prob = prob[row]
+    if np.ndim(max_velocity):
+        max_velocity = max_velocity[row]
+
+    draws = rng.random((3, len(velocity)))
+    new_lanes = lanes + np.where(draws[1] < 0.5, -1, 1)
+    trying = ((prob <= draws[0]) & (draws[2] < prob) & (0 <= new_lanes) &
+              (new_lanes < n_lanes))
+    replicas, lanes, cells, velocity, new_lanes, row = (
+        replicas[trying], lanes[trying], cells[trying], velocity[trying],
+        new_lanes[trying], row[trying])
+    if np.ndim(max_velocity):
+        max_velocity = max_velocity[trying]
+
+    # Gaps of the trying cars only, from bit scans of the occupancy
+    shared = bits is not None
+    if not shared:
+        bits = occupancy_bits(rows)
+    target_row = row + new_lanes - lanes
+    ahead = distance_ahead(bits, target_row, cells, lane_len)
+    ahead_here = distance_ahead(bits, row, cells, lane_len)
+    behind, found = distance_behind(bits, target_row, cells, lane_len)
+
+    target = replicas, new_lanes, cells
+    follower = np.where(found, rows[target_row, (cells - behind) % lane_len],
+                        -1)
+    reach = np.minimum(velocity + 1, max_velocity)
+
+    free = grid[target] == -1
+    safe = (follower < 0) | (behind > np.minimum(follower + 1, max_velocity))
+    gain = np.minimum(reach, ahead - 1) >= np.minimum(reach, ahead_here - 1)
+    switching = free & safe & gain
+
+    upward = np.zeros(grid.shape, dtype=bool)
+    moving_up = switching & (lanes < new_lanes)
+    upward[replicas[moving_up], new_lanes[moving_up],
+           cells[moving_up]] = True
+    switching &= ~((new_lanes < lanes) & upward[target])
+
+    grid[replicas[switching], lanes[switching], cells[switching]] = -1
+    grid[replicas[switching], new_lanes[switching],
+         cells[switching]] = velocity[switching]
+    accepted = int(np.count_nonzero(switching))
+    if accepted and shared:
+        bits[:] = occupancy_bits(rows)
+    return len(switching), accepted
+
+
+def merge(highway, hold, can_merge):
+    # Cars held in front of a blockage move to the free cell beside them,
+    # trying the lane above first, and leave at speed 1 or more. When two
+    # cars aim at the same cell the one coming from the lower lane wins.
+    # Returns the number of cars that merged.
+    n_lanes, lane_len = highway.shape[-2:]
+    grid = highway.reshape(-1, n_lanes, lane_len)
+    can_up, can_down = can_merge.reshape((2, ) + grid.shape)
+    replicas, lanes, cells = np.nonzero(hold.reshape(grid.shape))
+
+    above = np.minimum(lanes + 1, n_lanes - 1)
+    below = np.maximum(lanes - 1, 0)
+    up = can_up[replicas, lanes, cells] & (grid[replicas, above, cells] == -1)
+    down = ~up & can_down[replicas, lanes, cells] & (grid[replicas, below,
+                                                          cells] == -1)
+
+    upward = np.zeros(grid.shape, dtype=bool)
+    upward[replicas[up], above[up], cells[up]] = True
+    down &= ~upward[replicas, below, cells]
+
+    new_lanes = np.where(up, above, below)
+    moving = up | down
+    replicas, lanes, cells, new_lanes = (replicas[moving], lanes[moving],
+                                         cells[moving], new_lanes[moving])
+    grid[replicas, new_lanes, cells] = np.maximum(
+        1, grid[replicas, lanes, cells])
+    grid[replicas, lanes, cells] = -1
+    return len(cells)
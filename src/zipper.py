@@ -1,6 +1,6 @@
 import numpy as np
-import numpy.random as rand
 
+from src import vectorized
 from src.model import NSModel
 
 
@@ -13,12 +13,15 @@ class Zipper(NSModel):
                  lane_density=0.3,
                  lane_changes=True,
                  n_blocked=1,
-                 portion_blocked=0.2):
+                 portion_blocked=0.2,
+                 backend=None,
+                 seed=None):
         super().__init__(prob, n_lanes, lane_len, max_velocity, lane_density,
-                         lane_changes, False)
+                         lane_changes, False, backend, seed)
         self.n_blocked = n_blocked
         self.portion_blocked = portion_blocked
         self.blockages = {}
+        self.held = set()
         self.initialize_highway()
         # print("Original")
         # super().print_highway()
@@ -26,11 +29,11 @@ class Zipper(NSModel):
 
     def block_lanes(self):
         blocked_len = int(self.portion_blocked * self.lane_len)
-        blocked_lanes = rand.choice(self.n_lanes,
-                                    size=self.n_blocked,
-                                    replace=False)
+        blocked_lanes = self.rng.choice(self.n_lanes,
+                                        size=self.n_blocked,
+                                        replace=False)
         for lane in blocked_lanes:
-            pt_one = rand.randint(0, self.lane_len)
+            pt_one = self.rng.integers(0, self.lane_len)
             pt_two = (pt_one + blocked_len) % self.lane_len
             start = pt_one if pt_one < pt_two else pt_two
             end = pt_two if pt_one < pt_two else pt_one
@@ -39,6 +42,9 @@ class Zipper(NSModel):
             self.blockages[lane] = indices
             np.put(self.highway[lane], indices, [-2] * blocked_len)
 
+        self.block_distance, self.can_merge = vectorized.blockage_index(
+            self.highway)
+
     def populate_highway(self):
         n_cars = int(self.lane_len * self.lane_density)
         for lane in range(0, self.n_lanes):
@@ -47,12 +53,11 @@ class Zipper(NSModel):
                 self.blockages[lane]) if lane in self.blockages else np.arange(
                     0, self.lane_len)
             # TODO Make sure we're alloting the correct number of cars
-            indices = rand.choice(valid_range,
-                                  size=min(n_cars, len(valid_range)),
-                                  replace=False)
-            for index in indices:
-                self.highway[lane,
-                             index] = rand.randint(0, self.max_velocity + 1)
+            indices = self.rng.choice(valid_range,
+                                      size=min(n_cars, len(valid_range)),
+                                      replace=False)
+            self.highway[lane, indices] = self.rng.integers(
+                0, self.max_velocity + 1, size=len(indices))
 
     def initialize_highway(self):
         self.highway = super().highway_structure()
@@ -66,37 +71,45 @@ class Zipper(NSModel):
         self.highway[lane, pos] = -1
 
     def update_position(self):
+        # Moves every car that is not held in front of a blockage; the held
+        # ones wait for merge_cars
         updated_highway = self.highway.copy()
         for lane in updated_highway:
             lane[lane != -2] = -1
 
-        to_process = set()
+        self.held = set()
         for i in range(0, self.n_lanes):
             for j in range(0, self.lane_len):
-                if self.highway[i, j] < 0:
+                velocity = int(self.highway[i, j])
+                if velocity < 0:
                     continue
 
-                if self.highway[i, (j + self.highway[i, j] +
-                                    (1 if self.highway[i, j] == 0 else 0)) %
+                if self.highway[i, (j + velocity +
+                                    (1 if velocity == 0 else 0)) %
                                 self.lane_len] == -2:
-                    to_process.add((i, j))
-                    updated_highway[i, j] = self.highway[i, j]
+                    self.held.add((i, j))
+                    updated_highway[i, j] = velocity
                     continue
 
-                if self.lane_len <= j + self.highway[i, j]:
+                if self.lane_len <= j + velocity:
                     self.flow_count += 1
 
-                updated_highway[i, (j + self.highway[i, j]) %
-                                self.lane_len] = self.highway[i, j]
+                updated_highway[i, (j + velocity) % self.lane_len] = velocity
 
         self.highway = updated_highway
 
-        for i, j in to_process:
+    def merge_cars(self):
+        # Returns the number of held cars that merged
+        merges = 0
+        for i, j in self.held:
             direction = 1 if self.zipper_can_switch_lane(1, i, j) else - \
                 1 if self.zipper_can_switch_lane(-1, i, j) else 0
             if direction == 0:
                 continue
             self.zipper_merge(direction, i, j)
+            merges += 1
+        self.held = set()
+        return merges
 
     def zipper_can_switch_lane(self, direction=0, lane=0, pos=0):
         new_lane = lane + direction
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from src.checkpoint import Checkpointer, load_checkpoint, save_checkpoint
+from src.model import NSModel
+from src.recorder import TrajectoryRecorder, read_trajectory
+from src.zipper import Zipper
+
+
+@pytest.mark.parametrize("cls", [NSModel, Zipper])
+def test_round_trip(cls, tmp_path):
+    path = str(tmp_path / "run.npz")
+    model = cls(n_lanes=3, lane_len=80, backend="numpy", seed=3)
+    for _ in range(20):
+        model.simulate()
+    save_checkpoint(model, path, step=20)
+
+    loaded, extra = load_checkpoint(path)
+    assert type(loaded) is cls
+    assert int(extra["step"]) == 20
+    assert loaded.highway.dtype == np.int8
+    for _ in range(30):
+        model.simulate()
+        loaded.simulate()
+    assert np.array_equal(loaded.highway, model.highway)
+    assert loaded.flow_count == model.flow_count
+
+
+def test_resume(tmp_path):
+    path = str(tmp_path / "run.npz")
+    params = dict(lane_len=80, backend="numpy", seed=5)
+    reference = NSModel(**params)
+    for _ in range(50):
+        reference.simulate()
+
+    model, step = Checkpointer(path, every=10).resume(NSModel(**params))
+    assert step == 0
+    for _ in range(25):
+        model.simulate()
+
+    checkpointer = Checkpointer(path, every=10)
+    model, step = checkpointer.resume()
+    assert step == 20
+    for _ in range(50 - step):
+        model.simulate()
+    checkpointer.detach()
+    assert np.array_equal(model.highway, reference.highway)
+
+
+@pytest.mark.parametrize("recorder_first", [False, True])
+def test_with_recorder(tmp_path, recorder_first):
+    # Closing the recorder leaves the checkpointer attached, whichever of
+    # them wrapped the model first, and detaching both restores the plain
+    # step
+    model = NSModel(lane_len=80, backend="numpy", seed=2)
+    recorder = TrajectoryRecorder(str(tmp_path / "run.npy"))
+    checkpointer = Checkpointer(str(tmp_path / "run.npz"), every=5)
+    if recorder_first:
+        recorder.attach(model)
+        checkpointer.attach(model)
+    else:
+        checkpointer.attach(model)
+        recorder.attach(model)
+
+    for _ in range(5):
+        model.simulate()
+    recorder.close()
+    for _ in range(5):
+        model.simulate()
+    assert checkpointer.step == 10
+    assert int(load_checkpoint(checkpointer.path)[1]["step"]) == 10
+    assert len(read_trajectory(recorder.path)) == 6
+
+    checkpointer.detach()
+    assert "simulate" not in vars(model)
@@ -0,0 +1,25 @@
+import pytest
+
+from src.backends import BACKENDS
+from src.equivalence import (SPARSE, check_exact, check_lanes,
+                             check_statistics)
+
+KERNELS = [name for name in BACKENDS if name != "python"]
+
+
+@pytest.mark.parametrize("backend", KERNELS + [SPARSE])
+def test_exact(backend):
+    ok, detail = check_exact(backend)
+    assert ok, detail
+
+
+@pytest.mark.parametrize("backend", KERNELS)
+def test_lane_phase(backend):
+    ok, detail = check_lanes(backend)
+    assert ok, detail
+
+
+@pytest.mark.parametrize("backend", KERNELS + [SPARSE])
+def test_statistics(backend):
+    ok, detail = check_statistics(backend, steps=150, warmup=50)
+    assert ok, detail
@@ -0,0 +1,22 @@
+import numpy as np
+
+from src.ensemble import Ensemble
+from src.recorder import TrajectoryRecorder, read_trajectory
+
+
+def test_ensemble_advance(tmp_path):
+    # advance steps an ensemble like simulate does, and still through
+    # simulate once a recorder wraps it
+    params = dict(replicas=4, lane_len=60, lane_changes=True, seed=4)
+    reference = Ensemble(**params)
+    flows = [reference.simulate()[0] for _ in range(10)]
+    ensemble = Ensemble(**params)
+    series = ensemble.advance(10, ["flow"])
+    assert np.array_equal(ensemble.highway, reference.highway)
+    assert np.array_equal(series["flow"], flows)
+
+    path = str(tmp_path / "run.npy")
+    with TrajectoryRecorder(path) as recorder:
+        recorder.attach(ensemble)
+        ensemble.advance(5, observe=())
+    assert len(read_trajectory(path)) == 6
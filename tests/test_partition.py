@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from src.model import NSModel
+from src.partition import Segment, simulate_partitioned
+from src.zipper import Zipper
+
+
+@pytest.mark.parametrize("cls", [NSModel, Zipper])
+@pytest.mark.parametrize("workers", [1, 2, 3])
+@pytest.mark.parametrize("lane_changes", [False, True])
+def test_matches_numpy(cls, workers, lane_changes):
+    params = dict(n_lanes=3,
+                  lane_len=120,
+                  lane_density=0.3,
+                  prob=0.3,
+                  lane_changes=lane_changes,
+                  backend="numpy",
+                  seed=7)
+    model = cls(**params)
+    reference = cls(**params)
+    simulate_partitioned(model, 25, workers)
+    for _ in range(25):
+        reference.simulate()
+
+    assert np.array_equal(model.highway, reference.highway)
+    assert model.flow_count == reference.flow_count
+    assert model.rng.random() == reference.rng.random()
+
+
+def test_short_lane():
+    with pytest.raises(ValueError):
+        simulate_partitioned(NSModel(lane_len=20, backend="numpy"), 1, 4)
+
+
+def test_failed_worker(monkeypatch):
+    # The other workers are released from the barrier and the run fails
+    # instead of hanging
+    update_velocity = Segment.update_velocity
+
+    def failing(self):
+        if self.index == 1:
+            raise RuntimeError("segment failed")
+        update_velocity(self)
+
+    monkeypatch.setattr(Segment, "update_velocity", failing)
+    model = NSModel(lane_len=120, backend="numpy", seed=1)
+    highway = model.highway.copy()
+    with pytest.raises(RuntimeError):
+        simulate_partitioned(model, 10, 3)
+    assert np.array_equal(model.highway, highway)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from src.model import NSModel
+from src.recorder import TrajectoryRecorder, read_trajectory
+
+
+def run(path, steps, **options):
+    model = NSModel(lane_len=50, backend="numpy", seed=1)
+    frames = []
+    with TrajectoryRecorder(path, **options) as recorder:
+        recorder.attach(model)
+        frames.append(model.highway.copy())
+        for _ in range(steps):
+            model.simulate()
+            frames.append(model.highway.copy())
+    return np.array(frames)
+
+
+@pytest.mark.parametrize("every", [1, 3])
+def test_frames(tmp_path, every):
+    path = str(tmp_path / "run.npy")
+    frames = run(path, 20, every=every, chunk_size=4)
+    assert np.array_equal(read_trajectory(path), frames[::every])
+
+
+@pytest.mark.parametrize("steps", [2, 9, 10, 23])
+def test_ring(tmp_path, steps):
+    # The last `ring` frames survive, oldest first, whether or not the ring
+    # wrapped and wherever the last chunk ended
+    path = str(tmp_path / "run.npy")
+    frames = run(path, steps, ring=5, chunk_size=3)
+    assert np.array_equal(read_trajectory(path), frames[-5:])
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from src.validation import series_sweep
+from src.zipper import Zipper
+
+
+def series(frames, workers, **params):
+    with series_sweep([0.2, 0.5],
+                      replicas=2,
+                      steps=20,
+                      frames=frames,
+                      workers=workers,
+                      lane_len=60,
+                      **params) as results:
+        return {name: results[name].copy() for name in results.arrays}
+
+
+@pytest.mark.parametrize("params", [{}, {"model": Zipper}])
+def test_shared_rows(params):
+    # The rows written by pooled workers into shared memory match a serial
+    # run, and the step loop that also keeps the frames gives the same
+    # series as advance
+    expected = series(False, 1, **params)
+    pooled = series(True, 2, **params)
+    assert np.array_equal(pooled["flow"], expected["flow"])
+    assert np.allclose(pooled["velocity"], expected["velocity"],
+                       equal_nan=True)
+    assert pooled["frames"].shape == (4, 20, 3, 60)
+    cars = np.count_nonzero(0 <= pooled["frames"], axis=(2, 3))
+    assert (cars == cars[:, :1]).all()
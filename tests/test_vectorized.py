@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from src import vectorized
+from src.vectorized import WORD
+
+
+def scan(lane, pos, step):
+    distance = 1
+    while lane[(pos + step * distance) % len(lane)] == -1 and distance < len(
+            lane):
+        distance += 1
+    return distance
+
+
+@pytest.mark.parametrize("lane_len", [1, 7, 63, 64, 65, 200])
+@pytest.mark.parametrize("density", [0.0, 0.02, 0.3, 0.9])
+def test_gaps(lane_len, density):
+    rng = np.random.default_rng(lane_len)
+    rows = np.where(rng.random((4, lane_len)) < density, 2, -1).astype(np.int8)
+    rows[0] = -1
+    rows[1, :] = -1
+    rows[1, lane_len // 2] = 0
+    rows[2][rng.random(lane_len) < 0.1] = -2
+
+    lanes, cells = np.indices(rows.shape).reshape(2, -1)
+    ahead = vectorized.distance_ahead(vectorized.occupancy_bits(rows), lanes,
+                                      cells, lane_len)
+    behind, found = vectorized.distance_behind(
+        vectorized.occupancy_bits(rows), lanes, cells, lane_len)
+
+    # Exact within a word, at least past the longest reach beyond it
+    far = min(WORD + 1, lane_len)
+    for lane, cell, a, b, f in zip(lanes, cells, ahead, behind, found):
+        expected = scan(rows[lane], cell, 1)
+        assert a == (expected if expected <= WORD else far)
+        expected = scan(rows[lane], cell, -1)
+        occupied = (rows[lane] != -1).any()
+        assert f == (occupied and expected <= WORD)
+        if f:
+            assert b == expected
+
+
+def test_table_popcount(monkeypatch):
+    # The NumPy < 2 fallback counts the same bits as np.bitwise_count
+    rng = np.random.default_rng(0)
+    words = rng.integers(0, 2**64, (5, 7), dtype=np.uint64)
+    words[0] = [0, 1, 2**63, 2**64 - 1, 255, 256, 2**32]
+    expected = [[bin(int(word)).count("1") for word in row] for row in words]
+    counts = vectorized.table_popcount(words)
+    assert counts.dtype == np.uint8
+    assert np.array_equal(counts, expected)
+
+    # and gives the same gaps
+    monkeypatch.setattr(vectorized, "popcount", vectorized.table_popcount)
+    test_gaps(200, 0.3)
+
+
+@pytest.mark.parametrize("lane_len", [3, 50, 200])
+def test_lane_moves_update_bits(lane_len):
+    # The bitmap handed on by the lane phase is that of the road after it
+    rng = np.random.default_rng(lane_len)
+    highway = np.where(rng.random((2, 4, lane_len)) < 0.3,
+                       rng.integers(0, 6, (2, 4, lane_len)),
+                       -1).astype(np.int8)
+    for _ in range(20):
+        bits = vectorized.occupancy_bits(highway.reshape(-1, lane_len))
+        vectorized.update_lanes(highway, 0.5, 5, rng, bits)
+        assert np.array_equal(
+            bits, vectorized.occupancy_bits(highway.reshape(-1, lane_len)))
+        vectorized.update_velocity(highway, 0.5, 5, rng, bits)
+        highway, _ = vectorized.update_position(highway)
+
+
+def test_reach():
+    highway = np.full((1, 100), -1, dtype=np.int8)
+    with pytest.raises(ValueError):
+        vectorized.update_velocity(highway, 0.5, WORD,
+                                   np.random.default_rng())